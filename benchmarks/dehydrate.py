@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Compares the Bundle based list dehydration with ``Meta.fast_dehydrate``.
+
+Synthetic hits are dehydrated and serialized to JSON, so no Elasticsearch
+server is needed::
+
+    $ python benchmarks/dehydrate.py [hits] [repeat]
+
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.test.client import RequestFactory
+
+
+def make_hits(count):
+    return [{
+        "_index": "bench",
+        "_type": "bench",
+        "_id": str(i),
+        "_score": 1.0,
+        "_source": {
+            "first_name": "Person %d" % i,
+            "last_name": "Smith",
+            "number": i,
+            "tags": ["a", "b", "c"],
+            "address": {"street": "Main St.", "number": i, "city": "Barcelona"},
+        },
+    } for i in range(count)]
+
+
+def bench(resource, request, hits, repeat):
+    def run():
+        objects = resource.dehydrate_objects(request, hits)
+        resource.serialize(request, {"objects": objects}, "application/json")
+
+    return min(timeit.repeat(run, number=1, repeat=repeat))
+
+
+def main(count=500, repeat=20):
+    from benchmarks.urls import v1_api
+
+    request = RequestFactory().get('/api/v1/bench/')
+    hits = make_hits(count)
+
+    for name in ("bench", "fast"):
+        resource = v1_api._registry[name]
+        elapsed = bench(resource, request, hits, repeat)
+        print "%-8s %6d hits %10.2f ms" % (name, count, elapsed * 1000)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
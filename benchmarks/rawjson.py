@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Compares the decoded JSON list responses with ``Meta.raw_json``.
+
+A synthetic search response is turned into the JSON list of its hits,
+either decoded, dehydrated and serialized again, or with the raw hit
+sources passed through, so no Elasticsearch server is needed::
+
+    $ python benchmarks/rawjson.py [hits] [repeat]
+
+``json`` is the lower bound of decoding: the response is decoded and
+encoded again by the ``json`` module alone, without tastypie.
+
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+
+import django
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.test.client import RequestFactory
+
+
+def make_response(count):
+    hits = [{
+        "_index": "bench",
+        "_type": "bench",
+        "_id": str(i),
+        "_score": 1.0,
+        "_source": {
+            "first_name": "Person %d" % i,
+            "last_name": "Smith",
+            "number": i,
+            "bio": "Lorem \"ipsum\" dolor sit amet, consectetur adipiscing elit. " * 10,
+            "tags": ["tag %d" % j for j in range(20)],
+            "orders": [{
+                "id": j,
+                "price": j * 1.5,
+                "address": {"street": "Main St.", "number": j, "city": "Barcelona"},
+            } for j in range(20)],
+        },
+    } for i in range(count)]
+
+    return unicode(json.dumps({
+        "took": 1,
+        "timed_out": False,
+        "_shards": {"total": 1, "successful": 1, "failed": 0},
+        "hits": {"total": count, "max_score": 1.0, "hits": hits},
+    }))
+
+
+def decoded(resource, request, raw):
+    def run():
+        result = json.loads(raw)
+        objects = resource.dehydrate_objects(request, result["hits"]["hits"])
+        resource.serialize(request, {"objects": objects}, "application/json")
+    return run
+
+
+def plain(resource, request, raw):
+    def run():
+        result = json.loads(raw)
+        objects = []
+        for hit in result["hits"]["hits"]:
+            obj = dict(hit["_source"], resource_uri=resource.get_detail_uri(hit["_id"]))
+            objects.append(obj)
+        json.dumps({"objects": objects})
+    return run
+
+
+def passthrough(resource, request, raw):
+    from tastypie_elasticsearch import rawjson
+    from tastypie_elasticsearch.streaming import json_object_stream
+
+    def run():
+        result, hits = rawjson.split_search_response(raw)
+        items = (resource.raw_hit(hit, source) for hit, source in hits)
+        "".join(json_object_stream("{}", "objects", items))
+    return run
+
+
+def main(count=500, repeat=20):
+    from benchmarks.urls import v1_api
+
+    request = RequestFactory().get('/api/v1/bench/')
+    raw = make_response(count)
+    print "%d hits, %.1f KB" % (count, len(raw) / 1024.0)
+
+    runs = (
+        ("bench", decoded, "bench"),
+        ("fast", decoded, "fast"),
+        ("json", plain, "fast"),
+        ("raw", passthrough, "fast"),
+    )
+    for name, make_run, resource_name in runs:
+        run = make_run(v1_api._registry[resource_name], request, raw)
+        elapsed = min(timeit.repeat(run, number=1, repeat=repeat))
+        print "%-8s %6d hits %10.2f ms" % (name, count, elapsed * 1000)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,18 @@
+from tastypie_elasticsearch import resources
+
+
+class BenchResource(resources.ElasticsearchResource):
+
+    class Meta:
+        resource_name = 'bench'
+        index = "bench"
+        doc_type = "bench"
+
+
+class FastBenchResource(resources.ElasticsearchResource):
+
+    class Meta:
+        resource_name = 'fast'
+        index = "bench"
+        doc_type = "bench"
+        fast_dehydrate = True
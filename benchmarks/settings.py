@@ -0,0 +1,19 @@
+# Django settings for the benchmarks, they do not need Elasticsearch
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    }
+}
+
+SECRET_KEY = 'benchmarks'
+
+ROOT_URLCONF = 'benchmarks.urls'
+
+INSTALLED_APPS = (
+    'tastypie',
+    'tastypie_elasticsearch',
+)
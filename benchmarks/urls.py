@@ -0,0 +1,13 @@
+from django.conf.urls import patterns, include, url
+
+from tastypie import api
+
+from benchmarks import resources
+
+v1_api = api.Api(api_name='v1')
+v1_api.register(resources.BenchResource())
+v1_api.register(resources.FastBenchResource())
+
+urlpatterns = patterns('',
+    url(r'^api/', include(v1_api.urls)),
+)
@@ -31,7 +31,8 @@ setup(
     url = 'https://github.com/llonchj/django-tastypie-elasticsearch',
     keywords = "REST RESTful tastypie elasticsearch django",
     license = 'AGPLv3',
-    packages = find_packages(exclude=('*.tests', '*.tests.*', 'tests.*', 'tests')),
+    packages = find_packages(exclude=('*.tests', '*.tests.*', 'tests.*', 'tests',
+                                      'benchmarks.*', 'benchmarks')),
     classifiers = (
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Chunked writer for the Elasticsearch bulk API
+
+"""
+
+from multiprocessing.pool import ThreadPool
+
+
+class BulkWriter(object):
+    """
+    Buffers bulk actions and sends them to Elasticsearch in chunks of at
+    most ``max_actions`` actions and ``max_bytes`` bytes.
+
+    Chunks are flushed as soon as they fill up. When ``threads`` is greater
+    than one, up to ``threads`` chunks are sent concurrently; results are
+    still collected in the order the chunks were flushed. The items of
+    every chunk are merged into a single bulk response by ``close``, unless
+    ``keep_items`` is false. ``on_chunk``, if given, is called with the
+    response of every chunk as it is collected.
+
+    Any other keyword argument (e.g. ``refresh``) is passed to every
+    ``client.bulk`` call.
+    """
+
+    def __init__(self, client, index=None, doc_type=None, max_actions=500,
+                 max_bytes=10485760, threads=1, on_chunk=None, keep_items=True,
+                 **params):
+        self.client = client
+        self.index = index
+        self.doc_type = doc_type
+        self.max_actions = max_actions
+        self.max_bytes = max_bytes
+        self.threads = threads
+        self.on_chunk = on_chunk
+        self.keep_items = keep_items
+        self.params = params
+
+        self.serializer = client.transport.serializer
+        self.actions = 0
+
+        self._lines = []
+        self._chunk_actions = 0
+        self._chunk_bytes = 0
+
+        self._pool = ThreadPool(threads) if threads > 1 else None
+        self._pending = []
+
+        self.took = 0
+        self.errors = False
+        self.items = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.terminate()
+
+    def _dumps(self, data):
+        line = self.serializer.dumps(data)
+        if isinstance(line, unicode):
+            line = line.encode("utf-8")
+        return line
+
+    def add(self, action, source=None):
+        """
+        Queues a bulk ``action`` (e.g. ``{"index": {"_id": 1}}``) followed by
+        its ``source`` line, if any, flushing the current chunk first when
+        adding them would exceed the limits.
+        """
+        lines = [self._dumps(action)]
+        if source is not None:
+            lines.append(self._dumps(source))
+        size = sum(len(line) + 1 for line in lines)
+
+        if self._chunk_actions and (self._chunk_actions >= self.max_actions or
+                                    self._chunk_bytes + size > self.max_bytes):
+            self.flush()
+
+        self._lines.extend(lines)
+        self._chunk_actions += 1
+        self._chunk_bytes += size
+        self.actions += 1
+
+    def flush(self):
+        """Sends the current chunk, if any."""
+        if not self._lines:
+            return
+
+        body = "\n".join(self._lines) + "\n"
+        self._lines = []
+        self._chunk_actions = 0
+        self._chunk_bytes = 0
+
+        if self._pool is None:
+            self.collect(self.send(body))
+        else:
+            while len(self._pending) >= self.threads:
+                self.collect(self._pending.pop(0).get())
+            self._pending.append(self._pool.apply_async(self.send, (body,)))
+
+    def send(self, body):
+        return self.client.bulk(body, index=self.index, doc_type=self.doc_type,
+                                **self.params)
+
+    def collect(self, result):
+        """Merges the response of a chunk into the overall result."""
+        self.took += result.get("took", 0)
+        self.errors = self.errors or result.get("errors", False)
+        if self.on_chunk is not None:
+            self.on_chunk(result)
+        if self.keep_items:
+            self.items.extend(result.get("items", []))
+
+    def close(self):
+        """
+        Flushes the remaining actions, waits for every chunk in flight and
+        returns the merged bulk response.
+        """
+        self.flush()
+        while self._pending:
+            self.collect(self._pending.pop(0).get())
+        self.terminate()
+
+        return {
+            "took": self.took,
+            "errors": self.errors,
+            "items": self.items,
+        }
+
+    def terminate(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Caching helpers backed by Django's cache framework
+
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    from django.core.cache import caches
+except ImportError: # Django < 1.7
+    from django.core.cache import get_cache
+else:
+    def get_cache(alias):
+        return caches[alias]
+
+KEY_PREFIX = "tastypie_elasticsearch"
+
+# generations outlive any cached entry by far
+GENERATION_TIMEOUT = 30 * 24 * 60 * 60
+
+
+def make_key(*bits):
+    return ":".join((KEY_PREFIX,) + tuple(str(bit) for bit in bits))
+
+
+def canonical_hash(value):
+    """Returns a hash of ``value`` that does not depend on dict ordering."""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, separators=(',', ':'),
+                                   default=unicode)).hexdigest()
+
+
+class LocalCache(object):
+    """
+    In process cache with per entry timeouts, evicting the least recently
+    used entries beyond ``max_entries``.
+
+    Values are stored as they are, not copied, so callers must not mutate
+    them.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                return default
+
+            self._data[key] = entry
+            return value
+
+    def _set(self, key, value, timeout):
+        expires = time.time() + timeout if timeout else None
+        self._data.pop(key, None)
+        self._data[key] = (expires, value)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] >= time.time()):
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+# generations of the local backend, shared by every resource in the process
+_local_generations = LocalCache(max_entries=10000)
+
+
+class SearchCache(object):
+    """
+    Caches search responses under a canonical hash of the index, doc_type
+    and request body.
+
+    Keys also hold the current write generation of the index, so bumping
+    it (see ``bump_generation``) makes every previous entry unreachable.
+    The ``"django"`` backend uses the ``alias`` Django cache; the
+    ``"local"`` backend an in process LRU of ``max_entries``, whose
+    generations are only seen by this process.
+    """
+
+    def __init__(self, backend="django", ttl=5, max_entries=1000,
+                 alias="default", namespace="search"):
+        if backend == "django":
+            self.cache = get_cache(alias)
+            self.generations = self.cache
+        elif backend == "local":
+            self.cache = LocalCache(max_entries)
+            self.generations = _local_generations
+        else:
+            raise ValueError("Unknown search cache backend '%s'." % backend)
+
+        self.ttl = ttl
+        self.namespace = namespace
+
+    def get_generation(self, index):
+        key = make_key("generation", index)
+        generation = self.generations.get(key)
+        if generation is None:
+            self.generations.add(key, uuid.uuid4().hex, GENERATION_TIMEOUT)
+            generation = self.generations.get(key)
+        return generation
+
+    def bump_generation(self, index):
+        self.generations.set(make_key("generation", index), uuid.uuid4().hex,
+                             GENERATION_TIMEOUT)
+
+    def make_key(self, index, doc_type, body):
+        return make_key(self.namespace, index, self.get_generation(index),
+                        canonical_hash([index, doc_type, body]))
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.ttl)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP responses and conditional request helpers not provided by tastypie
+
+"""
+
+from django.http import HttpResponse
+
+
+class HttpPreconditionFailed(HttpResponse):
+    status_code = 412
+
+
+def parse_etags(header):
+    """
+    Returns the entity tags of an ``If-Match``/``If-None-Match`` header,
+    without their weak ``W/`` prefix.
+    """
+    etags = []
+    for etag in (header or "").split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        if etag:
+            etags.append(etag)
+    return etags
+
+
+def etag_matches(header, etag):
+    """Whether the ``If-None-Match`` style ``header`` matches ``etag``."""
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
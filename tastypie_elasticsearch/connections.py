@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide registry of pooled Elasticsearch clients
+
+"""
+
+import os
+import threading
+
+import elasticsearch
+
+_pid = None
+_lock = threading.Lock()
+_clients = {}
+_hosts = {}
+
+
+def _reset():
+    """
+    Drops every client built by the parent process after a fork, so
+    children never share sockets with it.
+    """
+    global _pid, _lock, _clients
+
+    _pid = os.getpid()
+    _lock = threading.Lock()
+    _clients = {}
+
+
+def parse_hosts(es_server):
+    """
+    Parses a ``"host:port,host:port"`` server list into the hosts list
+    expected by ``elasticsearch.Elasticsearch``.
+    """
+    hosts = _hosts.get(es_server)
+    if hosts is None:
+        hosts = []
+        for server in es_server.split(","):
+            host, port = server.strip().split(":")
+            hosts.append({"host":host, "port":port})
+        _hosts[es_server] = hosts
+    return hosts
+
+
+def get_client(es_server, connection_class, timeout, **options):
+    """
+    Returns the client shared by every caller in this process using the same
+    server list, connection class, timeout and client ``options``.
+    """
+    if _pid != os.getpid():
+        _reset()
+
+    key = (es_server, connection_class, timeout, repr(sorted(options.items())))
+
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = elasticsearch.Elasticsearch(hosts=parse_hosts(es_server),
+                                                     connection_class=connection_class,
+                                                     timeout=timeout,
+                                                     **options)
+                _clients[key] = client
+    return client
@@ -4,7 +4,12 @@ tastypie.Resource definitions for Elasticsearch
 
 """
 
+import base64
+import json
+import urllib
+
 from tastypie.bundle import Bundle
+from tastypie.exceptions import BadRequest
 from tastypie.paginator import Paginator
 #from tastypie.resources import Resource, DeclarativeMetaclass
 #from tastypie.exceptions import NotFound
@@ -12,22 +17,71 @@ from tastypie.paginator import Paginator
 #from tastypie import http
 
 
-class ElasticsearchResult(list):
+class ElasticsearchResult(object):
+    """
+    Wraps a search response, without copying it, as the sequence of its
+    hits. The response metadata is read from it on access.
+    """
+
+    __slots__ = ("result", "query")
+
     def __init__(self, result, query=None):
-        super(ElasticsearchResult, self).__init__(result["hits"]["hits"])
-
-        self.shards = result["_shards"]
-        self.took = result["took"]
-        self.timed_out = result["timed_out"]
-        self.total = result["hits"]["total"]
-        self.max_score = result["hits"]["max_score"]
-        self.facets = result.get("facets", [])
+        self.result = result
         self.query = query
 
+    @property
+    def hits(self):
+        return self.result["hits"]["hits"]
+
+    def __len__(self):
+        return len(self.hits)
+
+    def __iter__(self):
+        return iter(self.hits)
+
+    def __getitem__(self, index):
+        return self.hits[index]
+
+    @property
+    def shards(self):
+        return self.result["_shards"]
+
+    @property
+    def took(self):
+        return self.result["took"]
+
+    @property
+    def timed_out(self):
+        return self.result["timed_out"]
+
+    @property
+    def total(self):
+        return self.result["hits"]["total"]
+
+    @property
+    def max_score(self):
+        return self.result["hits"]["max_score"]
+
+    @property
+    def facets(self):
+        return self.result.get("facets", [])
+
+    @property
+    def aggregations(self):
+        return self.result.get("aggregations")
+
 class ElasticsearchPaginator(Paginator):
+    """
+    Paginates a search result. With ``count_only`` only the count of the
+    search is reported, without any page to link to.
+    """
 
     add_search_info = False
 
+    def __init__(self, request_data, objects, count_only=False, **kwargs):
+        super(ElasticsearchPaginator, self).__init__(request_data, objects, **kwargs)
+        self.count_only = count_only
+
     def get_count(self):
         return self.objects.total
 
@@ -56,7 +110,93 @@ class ElasticsearchPaginator(Paginator):
             output['meta']['search'] = search
         else:
             output['meta']['took'] = objects.took
+
+        if self.count_only:
+            output['meta'].update(limit=0, next=None, previous=None)
         if len(objects.facets):
             output["facets"] = objects.facets
+        if objects.aggregations is not None:
+            output['meta']['aggregations'] = objects.aggregations
+        return output
+
+
+def encode_cursor(values):
+    """Returns the opaque cursor for the sort values of a hit."""
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+def decode_cursor(cursor):
+    """Returns the sort values a cursor was made of."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(str(cursor)))
+    except (TypeError, ValueError):
+        raise BadRequest("Invalid cursor '%s'." % cursor)
+
+class ElasticsearchCursorPaginator(ElasticsearchPaginator):
+    """
+    Paginates with an opaque ``cursor`` instead of an ``offset``.
+
+    The cursor is made of the sort values of the last hit of the page; the
+    resource turns it into ``search_after``, so every page costs the same
+    however deep it is. Only ``next`` links are provided.
+    """
+
+    cursor_param = "cursor"
+
+    def get_offset(self):
+        return 0
+
+    def get_cursor(self):
+        limit = self.get_limit()
+        objects = self.objects
+
+        if not limit or len(objects) < limit:
+            return None
+
+        sort = objects[len(objects) - 1].get("sort")
+        if sort is None:
+            return None
+        return encode_cursor(sort)
+
+    def _generate_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+
+        try:
+            # QueryDict has a urlencode method that can handle multiple values for the same key
+            request_params = self.request_data.copy()
+            for key in ('limit', 'offset', self.cursor_param):
+                if key in request_params:
+                    del request_params[key]
+            request_params.update({'limit': limit, self.cursor_param: cursor})
+            encoded_params = request_params.urlencode()
+        except AttributeError:
+            request_params = {}
+
+            for k, v in self.request_data.items():
+                if isinstance(v, unicode):
+                    request_params[k] = v.encode('utf-8')
+                else:
+                    request_params[k] = v
+
+            for key in ('limit', 'offset'):
+                if key in request_params:
+                    del request_params[key]
+            request_params.update({'limit': limit, self.cursor_param: cursor})
+            encoded_params = urllib.urlencode(request_params)
+
+        return '%s?%s' % (self.resource_uri, encoded_params)
+
+    def page(self):
+        output = super(ElasticsearchCursorPaginator, self).page()
+
+        meta = output['meta']
+        del meta['offset']
+        meta['cursor'] = self.request_data.get(self.cursor_param)
+        meta['previous'] = None
+        meta['next'] = None
+
+        cursor = self.get_cursor()
+        if cursor is not None:
+            meta['next'] = self._generate_cursor_uri(meta['limit'], cursor)
         return output
-    
+
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers to walk the raw JSON text of Elasticsearch responses without
+decoding the documents they carry
+
+"""
+
+import json
+import re
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+SCALAR = re.compile(r'[^,:\]\}\s]+')
+TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]', re.DOTALL)
+
+# objects and arrays nested up to MAX_DEPTH levels are matched by a single
+# regular expression, deeper ones fall back to walking their tokens
+MAX_DEPTH = 16
+
+
+def _container(depth):
+    if not depth:
+        return r'(?!)'
+    return r'[\[{](?:[^"\[\]{}]+|%s|%s)*[\]}]' % (STRING.pattern, _container(depth - 1))
+
+CONTAINER = re.compile(_container(MAX_DEPTH), re.DOTALL)
+
+
+def skip_whitespace(s, pos):
+    return WHITESPACE.match(s, pos).end()
+
+
+def value_end(s, pos):
+    """Returns the position right after the JSON value starting at ``pos``."""
+    char = s[pos]
+    if char == '"':
+        return STRING.match(s, pos).end()
+
+    if char in '{[':
+        match = CONTAINER.match(s, pos)
+        if match is not None:
+            return match.end()
+
+        depth = 0
+        for match in TOKEN.finditer(s, pos):
+            token = match.group()
+            if token[0] == '"':
+                continue
+            if token in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+        raise ValueError("Unterminated JSON value at %d" % pos)
+
+    match = SCALAR.match(s, pos)
+    if match is None:
+        raise ValueError("Expected a JSON value at %d" % pos)
+    return match.end()
+
+
+def _member(s, pos):
+    """Reads the member key at ``pos``, returns it and where its value starts."""
+    key_end = STRING.match(s, pos).end()
+    key = s[pos + 1:key_end - 1]
+    if "\\" in key:
+        key = json.loads(s[pos:key_end])
+    colon = skip_whitespace(s, key_end)
+    return key, skip_whitespace(s, colon + 1)
+
+
+def _next(s, end, close):
+    """
+    Returns where the next member or element starts after the value ending
+    at ``end``, or ``None`` when the container is closed by ``close``.
+    """
+    pos = skip_whitespace(s, end)
+    if s[pos] == close:
+        return None
+    return skip_whitespace(s, pos + 1)
+
+
+def object_members(s, pos):
+    """
+    Returns the ``(key, value_start, value_end)`` members of the JSON object
+    starting at ``pos``, and the position right after the object.
+    """
+    members = []
+    pos = skip_whitespace(s, pos + 1)
+    if s[pos] == '}':
+        return members, pos + 1
+
+    while pos is not None:
+        key, start = _member(s, pos)
+        end = value_end(s, start)
+        members.append((key, start, end))
+        pos = _next(s, end, '}')
+    return members, skip_whitespace(s, end) + 1
+
+
+def member_start(s, pos, name):
+    """
+    Returns where the value of the member ``name`` of the JSON object
+    starting at ``pos`` starts, without scanning that value.
+    """
+    pos = skip_whitespace(s, pos + 1)
+    if s[pos] != '}':
+        while pos is not None:
+            key, start = _member(s, pos)
+            if key == name:
+                return start
+            pos = _next(s, value_end(s, start), '}')
+    raise ValueError("Missing member '%s' in the JSON object at %d" % (name, pos))
+
+
+def split_search_response(raw):
+    """
+    Splits the raw text of a search response into:
+
+        * The decoded response, with an empty ``hits.hits`` list.
+        * A list of ``(hit, source)`` pairs, ``hit`` being the decoded hit
+          without its ``_source``/``fields`` and ``source`` the raw text of
+          it, or ``None``.
+    """
+    hits_start = member_start(raw, skip_whitespace(raw, 0), "hits")
+    start = member_start(raw, hits_start, "hits")
+
+    # every hit is scanned once, its members are read as the array is walked
+    hits = []
+    pos = skip_whitespace(raw, start + 1)
+    end = pos
+    if raw[pos] == ']':
+        pos = None
+
+    while pos is not None:
+        members, end = object_members(raw, pos)
+
+        source = None
+        for key, value_start, value_stop in members:
+            if key == "_source" or (key == "fields" and source is None):
+                source = (value_start, value_stop)
+
+        if source is None:
+            hits.append((json.loads(raw[pos:end]), None))
+        else:
+            hit = json.loads(raw[pos:source[0]] + "null" + raw[source[1]:end])
+            hits.append((hit, raw[source[0]:source[1]]))
+
+        pos = _next(raw, end, ']')
+    end = skip_whitespace(raw, end) + 1
+
+    response = json.loads(raw[:start] + "[]" + raw[end:])
+    return response, hits
@@ -7,24 +7,61 @@ tastypie.Resource definitions for Elasticsearch
 import re
 import sys
 import json
+import urllib
+from collections import deque
+from itertools import islice
 from copy import deepcopy
 
 from django.conf import settings
 from django.conf.urls import url
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned, ValidationError, ImproperlyConfigured
+from django.core.urlresolvers import resolve, Resolver404, get_script_prefix, get_urlconf
+from django.http import QueryDict
 
 from tastypie import http
 from tastypie.bundle import Bundle
 from tastypie.fields import NOT_PROVIDED
 from tastypie.resources import Resource, DeclarativeMetaclass, convert_post_to_patch
-from tastypie.exceptions import NotFound, ImmediateHttpResponse
+from tastypie.constants import ALL, ALL_WITH_RELATIONS
+from tastypie.exceptions import NotFound, BadRequest, InvalidFilterError, ImmediateHttpResponse
 from tastypie.utils import dict_strip_unicode_keys, trailing_slash
+from tastypie.utils.mime import build_content_type
 
 import elasticsearch
 import elasticsearch.exceptions
 from elasticsearch.connection import Urllib3HttpConnection
 
+import connections
+import rawjson
+from conditional import HttpPreconditionFailed, parse_etags, etag_matches
+from cache import SearchCache, canonical_hash, get_cache, make_key
+from bulk import BulkWriter
+from singleflight import SingleFlight
 from paginator import ElasticsearchResult, ElasticsearchPaginator
+from paginator import ElasticsearchCursorPaginator, decode_cursor
+from streaming import StreamingHttpResponse, ClosingIterator
+from streaming import json_object_stream, json_array_stream, ndjson_stream, ndjson_lines
+
+REFRESH_ALWAYS = "always"
+REFRESH_NEVER = "never"
+REFRESH_REQUEST = "request"
+REFRESH_POLICIES = (REFRESH_ALWAYS, REFRESH_NEVER, REFRESH_REQUEST)
+
+LIST_VALIDATOR_STATS = "stats"
+LIST_VALIDATOR_GENERATION = "generation"
+LIST_VALIDATORS = (LIST_VALIDATOR_STATS, LIST_VALIDATOR_GENERATION)
+
+# ids that are never escaped when reversing a detail URI
+SAFE_DETAIL_URI_PK = re.compile(r"^[A-Za-z0-9_.-]+$")
+DETAIL_URI_PLACEHOLDER = "__pk__"
+
+# query parameters that are never filters
+RESERVED_PARAMS = ("offset", "limit", "query_type", "format", "order_by", 
+                   "refresh", "cursor", "fields", "count_only")
+FREE_TEXT_PARAM = "q"
+LOOKUP_SEP = "__"
+QUERY_TERMS = ("exact", "in", "gt", "gte", "lt", "lte", "range", "exists", 
+               "prefix", "match")
 
 class ElasticsearchDeclarativeMetaclass(DeclarativeMetaclass):
     """
@@ -41,15 +78,47 @@ class ElasticsearchDeclarativeMetaclass(DeclarativeMetaclass):
         override = {
             'object_class': dict,
             'include_mapping_fields': True,
-            'paginator_class': ElasticsearchPaginator,
+            'paginator_class': (ElasticsearchCursorPaginator
+                                if getattr(new_class._meta, 'cursor_pagination', False)
+                                else ElasticsearchPaginator),
         }
         defaults = {
             'es_server': getattr(settings, "ES_SERVER", "127.0.0.1:9200"),
             'es_connection_class': Urllib3HttpConnection,
             'es_timeout': 30,
+            'es_maxsize': None,
+            'es_sniff_on_start': False,
+            'es_sniff_on_connection_fail': False,
+            'es_sniffer_timeout': None,
+            'es_client_options': {},
             'create_if_missing': False,
             'index_settings': {},
             'write_index': None,
+            'cache_alias': 'default',
+            'mapping_cache_ttl': 300,
+            'search_cache': None,
+            'search_cache_ttl': 5,
+            'search_cache_size': 1000,
+            'coalesce_requests': False,
+            'aggregations': None,
+            'aggregations_cache': None,
+            'aggregations_cache_ttl': 60,
+            'mget_chunk_size': 1000,
+            'fast_dehydrate': False,
+            'raw_json': False,
+            'stream_list': False,
+            'list_validator': None,
+            'cursor_pagination': False,
+            'cursor_tiebreaker': '_id',
+            'export_scroll': '1m',
+            'export_batch_size': 500,
+            'percolate_chunk_size': 100,
+            'bulk_max_actions': 500,
+            'bulk_max_bytes': 10 * 1024 * 1024,
+            'bulk_threads': 1,
+            'refresh': REFRESH_ALWAYS,
+            'update_retry_on_conflict': 0,
+            'update_detect_noop': True,
         }
         for k,v in override.iteritems():
             setattr(new_class._meta, k, v)
@@ -71,6 +140,27 @@ class ElasticsearchResource(Resource):
     def __init__(self, api_name=None, *args, **kwargs):
         super(ElasticsearchResource, self).__init__(api_name, *args, **kwargs)
 
+        self._detail_uri_templates = {}
+        self.single_flight = SingleFlight()
+
+        if self._meta.fast_dehydrate:
+            declared = [name for name in self.fields if name != 'resource_uri']
+            if declared or self.dehydrate.im_func is not Resource.dehydrate.im_func:
+                raise ImproperlyConfigured("%s can not use fast_dehydrate: it "
+                    "declares fields or overrides dehydrate." % self.__class__.__name__)
+
+        validator = self._meta.list_validator
+        if validator is not None and validator not in LIST_VALIDATORS:
+            raise ImproperlyConfigured("%s: unknown list_validator '%s', expected "
+                "one of: %s." % (self.__class__.__name__, validator, ", ".join(LIST_VALIDATORS)))
+        if validator == LIST_VALIDATOR_GENERATION and (self._meta.search_cache != "django" or
+                                                       self._meta.refresh == REFRESH_NEVER):
+            # local generations are not shared between processes, and writes
+            # that are not refreshed bump the generation before they are seen
+            raise ImproperlyConfigured("%s: the generation list_validator needs the "
+                "\"django\" search_cache and a refresh policy other than \"never\"." % (
+                self.__class__.__name__))
+
         if self._meta.write_index is None:
             self._meta.write_index =  self._meta.index
 
@@ -78,6 +168,7 @@ class ElasticsearchResource(Resource):
             # create the index if missing and create_if_missing
             if not self.client.indices.exists(self._meta.write_index):
                 self.client.indices.create(self._meta.write_index, body=self._meta.index_settings)
+                self.invalidate_mapping_cache()
 
             # create the alias if missing and create_if_missing
             if (self._meta.write_index != self._meta.index and 
@@ -85,18 +176,32 @@ class ElasticsearchResource(Resource):
                                                          self._meta.write_index)):
                 self.client.indices.put_alias(self._meta.write_index, self._meta.index)
 
-    _es = None
+    _es_options = None
+    def get_client_options(self):
+        """
+        Returns the extra keyword arguments used to build the client, from
+        ``Meta.es_maxsize``, the ``Meta.es_sniff*`` options and
+        ``Meta.es_client_options``.
+        """
+        options = dict(self._meta.es_client_options)
+        if self._meta.es_maxsize is not None:
+            options['maxsize'] = self._meta.es_maxsize
+        if self._meta.es_sniff_on_start:
+            options['sniff_on_start'] = True
+        if self._meta.es_sniff_on_connection_fail:
+            options['sniff_on_connection_fail'] = True
+        if self._meta.es_sniffer_timeout is not None:
+            options['sniffer_timeout'] = self._meta.es_sniffer_timeout
+        return options
+
     def es__get(self):
-        if self._es is None:
-            hosts = []
-            for server in self._meta.es_server.split(","):
-                host, port = server.strip().split(":")
-                hosts.append({"host":host, "port":port})
-
-            self._es = elasticsearch.Elasticsearch(hosts=hosts, 
-                                                   connection_class=self._meta.es_connection_class,
-                                                   timeout=self._meta.es_timeout)
-        return self._es
+        if self._es_options is None:
+            self._es_options = self.get_client_options()
+
+        return connections.get_client(self._meta.es_server,
+                                      self._meta.es_connection_class,
+                                      self._meta.es_timeout,
+                                      **self._es_options)
     client = property(es__get)
 
     def prepend_urls(self):
@@ -105,9 +210,27 @@ class ElasticsearchResource(Resource):
         tr = trailing_slash()
         return [
             # percolate implementation
+            url(r"^(?P<resource_name>%s)/percolate/bulk%s$" % (resource_name, tr), 
+                self.wrap_view('post_percolate_bulk'), name="api_post_percolate_bulk"),
             url(r"^(?P<resource_name>%s)/percolate%s$" % (resource_name, tr), 
                 self.wrap_view('get_percolate'), name="api_get_percolate"),
 
+            # streamed NDJSON ingestion
+            url(r"^(?P<resource_name>%s)/bulk%s$" % (resource_name, tr), 
+                self.wrap_view('post_bulk'), name="api_post_bulk"),
+
+            # several list queries in a single round trip
+            url(r"^(?P<resource_name>%s)/msearch%s$" % (resource_name, tr), 
+                self.wrap_view('post_msearch'), name="api_post_msearch"),
+
+            # aggregations of the list query only
+            url(r"^(?P<resource_name>%s)/aggregations%s$" % (resource_name, tr), 
+                self.wrap_view('get_aggregations'), name="api_get_aggregations"),
+
+            # scroll based export of the whole result set
+            url(r"^(?P<resource_name>%s)/export%s$" % (resource_name, tr), 
+                self.wrap_view('get_export'), name="api_get_export"),
+
             # default implementation
             url(r"^(?P<resource_name>%s)%s$" % (resource_name, tr), 
                 self.wrap_view('dispatch_list'), name="api_dispatch_list"),
@@ -125,35 +248,71 @@ class ElasticsearchResource(Resource):
         schema = super(ElasticsearchResource, self).build_schema()
         
         if self._meta.include_mapping_fields:
-            mapping = self.client.indices.get_mapping(self._meta.index, self._meta.doc_type)
-            mapping_fields = mapping[self._meta.doc_type]["properties"]
-
             fields = schema["fields"]
 
-            for key, v in mapping_fields.iteritems():
+            for key, v in self.get_mapping_fields().iteritems():
                 if key not in fields:
-                    fields[key] = {
-                        "blank": v.get("default", True),
-                        "default": v.get("default", None),
-                        "help_text": v.get("help_text", key),
-                        "nullable": v.get("nullable", "unknown"),
-                        "readonly": v.get("readonly", True),
-                        "unique": v.get("unique", key in ["id",]),
-                        "type": v.get("type", "unknown"),
-                    }
+                    fields[key] = v
             schema["fields"] = fields
 
         return schema
+
+    def get_mapping_cache_key(self):
+        return make_key("mapping", self._meta.index, self._meta.doc_type)
+
+    def get_mapping_fields(self):
+        """
+        Returns the schema fields built from the index mapping.
+
+        They are cached for ``Meta.mapping_cache_ttl`` seconds in the
+        ``Meta.cache_alias`` Django cache; a falsy TTL disables the cache.
+        """
+        ttl = self._meta.mapping_cache_ttl
+        if ttl:
+            cache = get_cache(self._meta.cache_alias)
+            fields = cache.get(self.get_mapping_cache_key())
+            if fields is not None:
+                return fields
+
+        mapping = self.client.indices.get_mapping(self._meta.index, self._meta.doc_type)
+        mapping_fields = mapping[self._meta.doc_type]["properties"]
+
+        fields = {}
+        for key, v in mapping_fields.iteritems():
+            fields[key] = {
+                "blank": v.get("default", True),
+                "default": v.get("default", None),
+                "help_text": v.get("help_text", key),
+                "nullable": v.get("nullable", "unknown"),
+                "readonly": v.get("readonly", True),
+                "unique": v.get("unique", key in ["id",]),
+                "type": v.get("type", "unknown"),
+            }
+
+        if ttl:
+            cache.set(self.get_mapping_cache_key(), fields, ttl)
+        return fields
+
+    def invalidate_mapping_cache(self):
+        """Drops the cached mapping fields, e.g. after the mapping changed."""
+        get_cache(self._meta.cache_alias).delete(self.get_mapping_cache_key())
+
+    def put_mapping(self, body):
+        """Updates the mapping of ``Meta.doc_type`` and the cached schema."""
+        result = self.client.indices.put_mapping(index=self._meta.write_index,
+                                                 doc_type=self._meta.doc_type,
+                                                 body=body)
+        self.invalidate_mapping_cache()
+        return result
     
     def full_dehydrate(self, bundle, for_list=False):
         bundle = super(ElasticsearchResource, self).full_dehydrate(bundle, for_list)
 
-        kwargs = dict(resource_name=self._meta.resource_name, pk=bundle.obj.get("_id"))
-        if self._meta.api_name is not None:
-            kwargs['api_name'] = self._meta.api_name
-        bundle.data["resource_uri"] = self._build_reverse_url('api_dispatch_detail', kwargs=kwargs)
+        bundle.data["resource_uri"] = self.get_detail_uri(bundle.obj.get("_id"))
 
-        bundle.data.update(bundle.obj.get("_source", bundle.obj.get("fields")))
+        source = bundle.obj.get("_source", bundle.obj.get("fields"))
+        if source:
+            bundle.data.update(source)
         return bundle
     
     def full_hydrate(self, bundle):
@@ -170,17 +329,49 @@ class ElasticsearchResource(Resource):
         obj = (bundle_or_obj.obj if 
             isinstance(bundle_or_obj, Bundle) else bundle_or_obj)
 
+        return self.get_detail_uri(obj.get('_id'))
+
+    def get_detail_uri(self, pk):
+        """
+        Returns the detail URI of the document ``pk``.
+
+        The URI is reversed once per api name and URLconf. Ids made only of
+        characters that URL reversing never escapes are then formatted into
+        it; any other id is reversed as usual.
+        """
+        pk = unicode(pk)
+
+        key = (self._meta.api_name, get_urlconf(), get_script_prefix())
+        template = self._detail_uri_templates.get(key)
+
+        if template is None:
+            kwargs = {
+                'resource_name': self._meta.resource_name,
+                'pk': DETAIL_URI_PLACEHOLDER,
+            }
+            if self._meta.api_name is not None:
+                kwargs['api_name'] = self._meta.api_name
+
+            template = self._build_reverse_url("api_dispatch_detail",
+                                               kwargs=kwargs).split(DETAIL_URI_PLACEHOLDER)
+            self._detail_uri_templates[key] = template
+
+        if len(template) == 2 and SAFE_DETAIL_URI_PK.match(pk):
+            return pk.join(template)
+
         kwargs = {
             'resource_name': self._meta.resource_name,
-            'pk': obj.get('_id'),
+            'pk': pk,
         }
         if self._meta.api_name is not None:
             kwargs['api_name'] = self._meta.api_name
             
         return self._build_reverse_url("api_dispatch_detail", kwargs=kwargs)
 
-    def get_sorting(self, request, key="order_by"):
-        order_by = request.GET.get(key)
+    def get_sorting(self, request, key="order_by", params=None):
+        if params is None:
+            params = request.GET
+        order_by = params.get(key)
         if order_by:
             l = []
             
@@ -194,36 +385,288 @@ class ElasticsearchResource(Resource):
             return l
         return None
     
-    def build_query(self, request):
-        sort = self.get_sorting(request)
-        query = []
-
-        for key, value in request.GET.items():
-            if key not in ["offset", "limit", "query_type", "format", 'order_by']:
-                q = {".".join([self._meta.doc_type, key]): value}
-                query.append({"text":q})
-
-        if len(query) is 0:
-            # show all
-            query.append({"match_all": {}})
-        
+    def build_filters(self, filters=None):
+        """
+        Compiles the tastypie style filters (``field__lookup=value``) allowed
+        by ``Meta.filtering`` into Elasticsearch clauses.
+
+        Returns a dict with the non scoring, cacheable ``filter`` clauses
+        and the scoring ``must`` clauses, which only free text parameters
+        (``q`` and ``__match``) produce. Parameters on fields not in
+        ``Meta.filtering`` are ignored.
+        """
+        clauses = {"filter": [], "must": []}
+        if filters is None:
+            return clauses
+
+        for filter_expr, value in filters.items():
+            if filter_expr in RESERVED_PARAMS:
+                continue
+
+            if filter_expr == FREE_TEXT_PARAM:
+                clauses["must"].append({"query_string": {"query": value}})
+                continue
+
+            filter_bits = filter_expr.split(LOOKUP_SEP)
+            filter_type = 'exact'
+            if len(filter_bits) > 1 and filter_bits[-1] in QUERY_TERMS:
+                filter_type = filter_bits.pop()
+            field_name = LOOKUP_SEP.join(filter_bits)
+
+            if field_name not in self._meta.filtering:
+                continue
+
+            allowed = self._meta.filtering[field_name]
+            if allowed not in (ALL, ALL_WITH_RELATIONS) and filter_type not in allowed:
+                raise InvalidFilterError("'%s' is not an allowed filter on the '%s' field." % (
+                    filter_type, field_name))
+
+            if hasattr(filters, 'getlist'):
+                values = filters.getlist(filter_expr)
+            else:
+                values = value if isinstance(value, (list, tuple)) else [value]
+
+            clause = self.build_filter(field_name, filter_type, values)
+            if filter_type == 'match':
+                clauses["must"].append(clause)
+            else:
+                clauses["filter"].append(clause)
+        return clauses
+
+    def build_filter(self, field_name, filter_type, values):
+        """Returns the Elasticsearch clause of a single filter."""
+        value = values[-1]
+
+        if filter_type == 'exact':
+            return {"term": {field_name: value}}
+
+        if filter_type == 'in':
+            terms = []
+            for v in values:
+                terms.extend(v.split(",") if isinstance(v, basestring) else [v])
+            return {"terms": {field_name: terms}}
+
+        if filter_type in ('gt', 'gte', 'lt', 'lte'):
+            return {"range": {field_name: {filter_type: value}}}
+
+        if filter_type == 'range':
+            bounds = value.split(",") if isinstance(value, basestring) else value
+            if len(bounds) != 2:
+                raise InvalidFilterError("Range filter on '%s' needs two values." % field_name)
+            return {"range": {field_name: {"gte": bounds[0], "lte": bounds[1]}}}
+
+        if filter_type == 'exists':
+            clause = {"exists": {"field": field_name}}
+            if unicode(value).lower() in ('false', '0', 'no'):
+                return {"bool": {"must_not": clause}}
+            return clause
+
+        if filter_type == 'prefix':
+            return {"prefix": {field_name: value}}
+
+        if filter_type == 'match':
+            return {"match": {field_name: value}}
+
+        raise InvalidFilterError("Unknown filter '%s'." % filter_type)
+
+    def get_source_filter(self, request=None, params=None):
+        """
+        Returns the ``_source`` filter limiting documents to ``Meta.fields``
+        minus ``Meta.excludes``, further narrowed by the comma separated
+        ``fields`` query parameter of ``params`` (``request.GET`` by default).
+
+        Returns ``None`` when the whole source is needed, and ``False`` when
+        none of the requested fields is allowed.
+        """
+        includes = list(self._meta.fields or [])
+        excludes = list(self._meta.excludes or [])
+
+        if params is None and request is not None:
+            params = request.GET
+        requested = params.get("fields") if params is not None else None
+        if requested:
+            requested = [field.strip() for field in requested.split(",") if field.strip()]
+            if includes:
+                requested = [field for field in requested
+                             if any(field == allowed or field.startswith(allowed + ".")
+                                    for allowed in includes)]
+                if not requested:
+                    return False
+            includes = requested
+
+        if not includes and not excludes:
+            return None
+
+        source = {}
+        if includes:
+            source["includes"] = includes
+        if excludes:
+            source["excludes"] = excludes
+        return source
+
+    def get_source_params(self, source):
+        """Returns the query parameters of a ``_source`` filter for get requests."""
+        if source is None:
+            return {}
+        if source is False:
+            return {"_source": "false"}
+
+        params = {}
+        if source.get("includes"):
+            params["_source_include"] = ",".join(source["includes"])
+        if source.get("excludes"):
+            params["_source_exclude"] = ",".join(source["excludes"])
+        return params
+
+    def build_query(self, request, params=None, count_only=False):
+        """
+        Compiles the list query parameters, ``request.GET`` unless
+        ``params`` is given, into a search body. The JSON body of the
+        request, if any, is merged on top of it.
+
+        With ``count_only``, the search only asks for the total count.
+        """
+        if params is None:
+            params = request.GET
+
+        sort = self.get_sorting(request, params=params)
+        clauses = self.build_filters(params)
+        source = self.get_source_filter(request, params)
+
         result = {
-            "from": long(request.GET.get("offset", 0)),
-            "size": long(request.GET.get("limit", self._meta.limit)),
+            "from": long(params.get("offset", 0)),
+            "size": long(params.get("limit", self._meta.limit)),
             "sort": sort or [],
         }
+
+        if clauses["filter"] or clauses["must"]:
+            result["query"] = {
+                "bool": dict((k, v) for k, v in clauses.items() if v),
+            }
+
+        if source is not None:
+            result["_source"] = source
+
+        if self._meta.aggregations:
+            result["aggs"] = deepcopy(self._meta.aggregations)
+
+        if self._meta.cursor_pagination:
+            # sort values must be unique for search_after to be reliable
+            sort = result["sort"] or [{"_score": "desc"}]
+            tiebreaker = self._meta.cursor_tiebreaker
+            if tiebreaker not in [key for item in sort for key in item]:
+                sort.append({tiebreaker: "asc"})
+
+            result["sort"] = sort
+            result["from"] = 0
+
+            cursor = params.get("cursor")
+            if cursor:
+                result["search_after"] = decode_cursor(cursor)
+
+        if count_only:
+            # only hits.total is needed: no hits, hence no sorting nor source
+            result.update({"from": 0, "size": 0, "_source": False})
+            for key in ("sort", "search_after", "aggs"):
+                result.pop(key, None)
+
         # extend result dict if body is present
-        if request.body:
+        if params is request.GET and request.body:
             result.update(json.loads(request.body))
 
         return result
 
+    def is_count_only(self, params):
+        """
+        Whether only the total count is requested, with ``limit=0`` or the
+        ``count_only`` query parameter.
+        """
+        if unicode(params.get("limit", "")) == "0":
+            return True
+        return unicode(params.get("count_only", "")).lower() in ("1", "true", "yes")
+
+    _search_cache = None
+    def get_search_cache(self):
+        """
+        Returns the ``SearchCache`` configured by ``Meta.search_cache``, or
+        ``None`` when search responses are not cached.
+        """
+        if self._meta.search_cache is None:
+            return None
+
+        if self._search_cache is None:
+            self._search_cache = SearchCache(self._meta.search_cache,
+                                             ttl=self._meta.search_cache_ttl,
+                                             max_entries=self._meta.search_cache_size,
+                                             alias=self._meta.cache_alias)
+        return self._search_cache
+
+    _aggregations_cache = None
+    def get_aggregations_cache(self):
+        """
+        Returns the ``SearchCache`` configured by ``Meta.aggregations_cache``
+        for the ``aggregations/`` endpoint, or ``None``.
+        """
+        if self._meta.aggregations_cache is None:
+            return None
+
+        if self._aggregations_cache is None:
+            self._aggregations_cache = SearchCache(self._meta.aggregations_cache,
+                                                   ttl=self._meta.aggregations_cache_ttl,
+                                                   max_entries=self._meta.search_cache_size,
+                                                   alias=self._meta.cache_alias,
+                                                   namespace="aggs")
+        return self._aggregations_cache
+
+    def execute_search(self, body):
+        """
+        Runs a search with ``body``, through the search cache when
+        ``Meta.search_cache`` is set.
+        """
+        return self.cached_search(self.get_search_cache(), body)
+
+    def cached_search(self, cache, body, raw=False):
+        """
+        Runs a search with ``body``, through ``cache`` unless ``None``.
+        With ``raw``, returns the raw text of the response instead.
+        """
+        if cache is not None:
+            key = cache.make_key(self._meta.index, self._meta.doc_type,
+                                 {"raw": body} if raw else body)
+            result = cache.get(key)
+            if result is not None:
+                return result
+
+        if raw:
+            result = self.coalesce(("raw_search", body), self.send_raw_search, body)
+        else:
+            result = self.coalesce(("search", body), self.client.search,
+                                   self._meta.index, self._meta.doc_type, body=body)
+        if cache is not None:
+            cache.set(key, result)
+        return result
+
+    def coalesce(self, key, fn, *args, **kwargs):
+        """
+        Calls ``fn``, sharing a single call between the concurrent callers
+        with the same ``key`` when ``Meta.coalesce_requests`` is set.
+
+        Every caller gets its own shallow copy of a shared dict result.
+        ``self.single_flight.stats()`` counts the coalesced calls.
+        """
+        if not self._meta.coalesce_requests:
+            return fn(*args, **kwargs)
+
+        key = canonical_hash([self._meta.index, self._meta.doc_type, key])
+        result = self.single_flight.do(key, fn, *args, **kwargs)
+        return dict(result) if isinstance(result, dict) else result
+
     def get_object_list(self, request):
         kwargs = dict()
-        kwargs['body'] = self.build_query(request)
+        kwargs['body'] = self.build_query(request, count_only=self.is_count_only(request.GET))
 
         try:
-            result = self.client.search(self._meta.index, self._meta.doc_type, **kwargs)
+            result = self.execute_search(kwargs['body'])
         except Exception, exc:
             response = http.HttpBadRequest(str(exc), content_type="text/plain")
             raise ImmediateHttpResponse(response)
@@ -234,10 +677,320 @@ class ElasticsearchResource(Resource):
         # Filtering disabled for brevity...
         return self.get_object_list(kwargs['bundle'].request)
 
+    def get_index_validator(self):
+        """
+        Returns a value that changes whenever the searchable content of the
+        index may have changed, as configured by ``Meta.list_validator``:
+
+            * ``"stats"``: the document, indexing and refresh counters of
+              the primary shards.
+            * ``"generation"``: the write generation of the search cache,
+              only bumped by writes made through the resources, and the
+              refresh counter, so writes become visible once refreshed.
+        """
+        if self._meta.list_validator == LIST_VALIDATOR_GENERATION:
+            stats = self.client.indices.stats(index=self._meta.index, metric="refresh")
+            return [
+                self.get_search_cache().get_generation(self._meta.index),
+                stats["_all"]["primaries"]["refresh"]["total"],
+            ]
+
+        stats = self.client.indices.stats(index=self._meta.index,
+                                          metric="docs,indexing,refresh")
+        primaries = stats["_all"]["primaries"]
+        return [
+            primaries["docs"]["count"],
+            primaries["docs"]["deleted"],
+            primaries["indexing"]["index_total"],
+            primaries["indexing"]["delete_total"],
+            primaries["refresh"]["total"],
+        ]
+
+    def get_list_etag(self, request):
+        """
+        Returns the ETag of a list request, a hash of its query and of the
+        index validator, or ``None`` when ``Meta.list_validator`` is unset.
+        """
+        if self._meta.list_validator is None:
+            return None
+
+        try:
+            validator = self.get_index_validator()
+        except elasticsearch.exceptions.ElasticsearchException:
+            return None
+
+        return '"%s"' % canonical_hash([
+            self._meta.index,
+            self._meta.doc_type,
+            sorted(request.GET.lists()),
+            request.body,
+            self.determine_format(request),
+            validator,
+        ])
+
+    def get_list(self, request, **kwargs):
+        """
+        Returns a serialized list of resources.
+
+        Same as ``Resource.get_list``, with the hits dehydrated by
+        ``dehydrate_objects``.
+
+        With ``Meta.list_validator`` the response carries an ``ETag``, and a
+        request whose ``If-None-Match`` still matches it gets an empty
+        ``304 Not Modified`` without any search.
+        """
+        etag = self.get_list_etag(request)
+        if etag is not None and etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            response = http.HttpNotModified()
+            response['ETag'] = etag
+            return response
+
+        response = self.build_list_response(request, **kwargs)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
+    def build_list_response(self, request, **kwargs):
+        """
+        Searches and returns the serialized list of resources.
+
+        With ``Meta.stream_list``, JSON lists are streamed: the envelope is
+        serialized first, then each hit is dehydrated and serialized only
+        as it is written out.
+        """
+        if self._meta.raw_json and self.determine_format(request) == 'application/json':
+            return self.get_list_raw(request, **kwargs)
+
+        base_bundle = self.build_bundle(request=request)
+        objects = self.obj_get_list(bundle=base_bundle, **self.remove_api_resource_names(kwargs))
+        sorted_objects = self.apply_sorting(objects, options=request.GET)
+
+        paginator = self._meta.paginator_class(request.GET, sorted_objects, 
+            resource_uri=self.get_resource_uri(), limit=self._meta.limit, 
+            max_limit=self._meta.max_limit, collection_name=self._meta.collection_name,
+            count_only=self.is_count_only(request.GET))
+        to_be_serialized = paginator.page()
+
+        collection_name = self._meta.collection_name
+        if self._meta.stream_list and self.determine_format(request) == 'application/json':
+            objects = to_be_serialized.pop(collection_name)
+            to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+            head = self.serialize(request, to_be_serialized, 'application/json')
+
+            items = (self.serialize(request, obj, 'application/json')
+                     for obj in self.iter_dehydrate_objects(request, objects))
+            return StreamingHttpResponse(json_object_stream(head, collection_name, items),
+                                         content_type=build_content_type('application/json'))
+
+        to_be_serialized[collection_name] = self.dehydrate_objects(request,
+            to_be_serialized[collection_name])
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.create_response(request, to_be_serialized)
+
+    def raw_search(self, body):
+        """
+        Runs a search with ``body`` and returns the raw text of the response,
+        without decoding it, through the search cache and coalescing like
+        ``execute_search``.
+        """
+        return self.cached_search(self.get_search_cache(), body, raw=True)
+
+    def send_raw_search(self, body):
+        """
+        Sends a search with ``body`` over the connections of the client
+        transport, without decoding the response.
+
+        Retries, dead connection marking and sniffing are handled as in
+        ``Transport.perform_request``, which always decodes responses.
+        """
+        transport = self.client.transport
+        path = "/%s/%s/_search" % (urllib.quote(self._meta.index, safe=","),
+                                   urllib.quote(self._meta.doc_type, safe=","))
+        body = transport.serializer.dumps(body)
+
+        max_retries = getattr(transport, 'max_retries', 3)
+        for attempt in range(max_retries + 1):
+            connection = transport.get_connection()
+            try:
+                response = connection.perform_request("POST", path, body=body)
+            except elasticsearch.exceptions.TransportError, exc:
+                if isinstance(exc, elasticsearch.exceptions.ConnectionTimeout):
+                    retry = getattr(transport, 'retry_on_timeout', False)
+                elif isinstance(exc, elasticsearch.exceptions.ConnectionError):
+                    retry = True
+                else:
+                    retry = exc.status_code in getattr(transport, 'retry_on_status', ())
+
+                if not retry or attempt == max_retries:
+                    raise
+                if isinstance(exc, elasticsearch.exceptions.ConnectionError):
+                    transport.mark_dead(connection)
+            else:
+                transport.connection_pool.mark_live(connection)
+                # the response body is always the last item
+                return response[-1]
+
+    def get_list_raw(self, request, **kwargs):
+        """
+        Returns the list of resources as JSON, passing the hit sources
+        through as they come from Elasticsearch.
+
+        Only the ``meta``/``facets`` envelope is decoded and serialized, each
+        hit is its raw ``_source`` (or ``fields``) with the ``resource_uri``
+        added. ``alter_list_data_to_serialize`` gets the envelope only.
+        """
+        body = self.build_query(request, count_only=self.is_count_only(request.GET))
+
+        try:
+            result, hits = rawjson.split_search_response(self.raw_search(body))
+        except Exception, exc:
+            response = http.HttpBadRequest(str(exc), content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+
+        # keep the hit metadata for the paginator, e.g. the cursor sort values
+        result["hits"]["hits"] = [hit for hit, source in hits]
+        objects = ElasticsearchResult(result, dict(body=body))
+        paginator = self._meta.paginator_class(request.GET, objects, 
+            resource_uri=self.get_resource_uri(), limit=self._meta.limit, 
+            max_limit=self._meta.max_limit, collection_name=self._meta.collection_name,
+            count_only=self.is_count_only(request.GET))
+        to_be_serialized = paginator.page()
+
+        collection_name = self._meta.collection_name
+        del to_be_serialized[collection_name]
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        head = self.serialize(request, to_be_serialized, 'application/json')
+
+        items = (self.raw_hit(hit, source) for hit, source in hits)
+        return StreamingHttpResponse(json_object_stream(head, collection_name, items),
+                                     content_type=build_content_type('application/json'))
+
+    def raw_hit(self, hit, source):
+        """
+        Returns the JSON text of a hit from its raw ``source``, with the
+        ``resource_uri`` added in front.
+        """
+        uri = json.dumps(self.get_detail_uri(hit.get("_id")))
+
+        rest = source.strip()[1:] if source and source.lstrip().startswith("{") else "}"
+        if rest.lstrip().startswith("}"):
+            return '{"resource_uri": %s}' % uri
+        return '{"resource_uri": %s, %s' % (uri, rest)
+
+    def dehydrate_objects(self, request, objects):
+        """
+        Dehydrates a list of hits in preparation for serialization.
+
+        With ``Meta.fast_dehydrate`` every hit is turned straight into a
+        dict by ``dehydrate_hit``; otherwise each one goes through a Bundle
+        and ``full_dehydrate``.
+        """
+        return list(self.iter_dehydrate_objects(request, objects))
+
+    def iter_dehydrate_objects(self, request, objects):
+        """Same as ``dehydrate_objects``, one hit at a time."""
+        if self._meta.fast_dehydrate:
+            for hit in objects:
+                yield self.dehydrate_hit(hit)
+            return
+
+        for obj in objects:
+            bundle = self.build_bundle(obj=obj, request=request)
+            yield self.full_dehydrate(bundle, for_list=True)
+
+    def dehydrate_hit(self, hit):
+        """
+        Returns the output dict of a hit: its ``resource_uri`` plus its
+        ``_source`` (or ``fields``).
+        """
+        data = {"resource_uri": self.get_detail_uri(hit.get("_id"))}
+        source = hit.get("_source", hit.get("fields"))
+        if source:
+            data.update(source)
+        return data
+
+    def get_etag(self, obj):
+        """Returns the ETag of a document, made of its ``_version``, or ``None``."""
+        version = obj.get("_version") if isinstance(obj, dict) else None
+        if version is None:
+            return None
+        return '"%s"' % version
+
+    def get_expected_version(self, request=None):
+        """
+        Returns the ``_version`` the ``If-Match`` header of ``request``
+        expects the document to be at, or ``None`` when there is none.
+        """
+        if request is None:
+            return None
+
+        etags = parse_etags(request.META.get('HTTP_IF_MATCH'))
+        if not etags or "*" in etags:
+            return None
+        if len(etags) > 1:
+            raise BadRequest("Only one version can be expected with If-Match.")
+
+        try:
+            return long(etags[0].strip('"'))
+        except ValueError:
+            raise BadRequest("Invalid If-Match version %s." % etags[0])
+
+    def get_version_params(self, request=None):
+        """Returns the ``version`` parameter of a write checked by ``If-Match``."""
+        version = self.get_expected_version(request)
+        if version is None:
+            return {}
+        return {"version": version}
+
+    def precondition_failed(self, exc):
+        """Returns the response of a write whose ``If-Match`` version is stale."""
+        response = HttpPreconditionFailed(str(exc), content_type="text/plain")
+        return ImmediateHttpResponse(response)
+
+    def get_detail(self, request, **kwargs):
+        """
+        Returns a single serialized resource.
+
+        Same as ``Resource.get_detail``, with the ``_version`` of the
+        document as ``ETag``. A request whose ``If-None-Match`` matches it
+        gets an empty ``304 Not Modified``.
+        """
+        basic_bundle = self.build_bundle(request=request)
+
+        try:
+            obj = self.cached_obj_get(bundle=basic_bundle, **self.remove_api_resource_names(kwargs))
+        except ObjectDoesNotExist:
+            return http.HttpNotFound()
+        except MultipleObjectsReturned:
+            return http.HttpMultipleChoices("More than one resource is found at this URI.")
+
+        etag = self.get_etag(obj)
+        if etag is not None and etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+            response = http.HttpNotModified()
+            response['ETag'] = etag
+            return response
+
+        bundle = self.build_bundle(obj=obj, request=request)
+        bundle = self.full_dehydrate(bundle)
+        bundle = self.alter_detail_data_to_serialize(request, bundle)
+        response = self.create_response(request, bundle)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
     def obj_get(self, request=None, **kwargs):
+        request = getattr(kwargs.get('bundle'), 'request', request)
         pk = kwargs.get("pk")
+
+        # only reads are filtered, writes need the whole document
+        params = {}
+        if request is not None and request.method == 'GET':
+            params = self.get_source_params(self.get_source_filter(request))
+
         try:
-            result =  self.client.get(self._meta.index, pk, self._meta.doc_type)
+            result = self.coalesce(("get", pk, params), self.client.get,
+                                   self._meta.index, pk, self._meta.doc_type,
+                                   params=params)
         except elasticsearch.exceptions.NotFoundError, exc:
             response = http.HttpNotFound("Not found", content_type="text/plain")
             raise ImmediateHttpResponse(response)
@@ -248,13 +1001,137 @@ class ElasticsearchResource(Resource):
         else:
             return result
 
+    def get_pk_via_uri(self, uri):
+        """
+        Resolves a resource URI into the id of the document it points to.
+
+        The URI must refer to a resource of this type.
+        """
+        prefix = get_script_prefix()
+        chomped_uri = uri
+
+        if prefix and chomped_uri.startswith(prefix):
+            chomped_uri = chomped_uri[len(prefix)-1:]
+
+        try:
+            view, args, kwargs = resolve(chomped_uri)
+        except Resolver404:
+            raise NotFound("The URL provided '%s' was not a link to a valid resource." % uri)
+
+        if (kwargs.get('resource_name') != self._meta.resource_name or
+                self._meta.detail_uri_name not in kwargs):
+            raise BadRequest("The URL provided '%s' is not a %s resource." % (uri,
+                self._meta.resource_name))
+
+        return kwargs[self._meta.detail_uri_name]
+
+    def mget_objects(self, ids, source=None):
+        """
+        Fetches the documents for ``ids`` with multi-get requests of at most
+        ``Meta.mget_chunk_size`` ids each, limiting their ``_source`` to the
+        ``source`` filter, if any.
+
+        Returns a dict mapping the id of every existing document to it.
+        """
+        ids = list(set(ids))
+        size = self._meta.mget_chunk_size
+        params = self.get_source_params(source)
+        objects = {}
+
+        for i in range(0, len(ids), size):
+            try:
+                result = self.client.mget({"ids": ids[i:i + size]},
+                                          index=self._meta.index,
+                                          doc_type=self._meta.doc_type,
+                                          params=params)
+            except Exception, exc:
+                response = http.HttpBadRequest(str(exc), content_type="text/plain")
+                raise ImmediateHttpResponse(response)
+
+            for doc in result["docs"]:
+                if doc.get("found", doc.get("exists", False)):
+                    objects[doc["_id"]] = doc
+        return objects
+
+    def get_multiple(self, request, **kwargs):
+        """
+        Returns a serialized list of resources based on the identifiers
+        from the URL.
+
+        All the identifiers are fetched with a single multi-get request,
+        keeping the order they were requested in. Identifiers that do not
+        exist are reported back under ``not_found``.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        kwarg_name = '%s_list' % self._meta.detail_uri_name
+        obj_identifiers = kwargs.get(kwarg_name, '').split(';')
+
+        existing = self.mget_objects(obj_identifiers, self.get_source_filter(request))
+
+        objects = []
+        not_found = []
+
+        for identifier in obj_identifiers:
+            if identifier in existing:
+                bundle = self.build_bundle(obj=existing[identifier], request=request)
+                objects.append(self.full_dehydrate(bundle, for_list=True))
+            else:
+                not_found.append(identifier)
+
+        object_list = {
+            self._meta.collection_name: objects,
+        }
+
+        if len(not_found):
+            object_list['not_found'] = not_found
+
+        self.log_throttled_access(request)
+        return self.create_response(request, object_list)
+
+    def get_refresh_policy(self, request=None):
+        """
+        Returns the refresh policy for the writes of ``request``.
+
+        Defaults to ``Meta.refresh`` and can be overridden per request with
+        the ``refresh`` query parameter.
+        """
+        policy = self._meta.refresh
+        if request is not None:
+            policy = request.GET.get("refresh", policy)
+
+        if policy not in REFRESH_POLICIES:
+            raise BadRequest("Invalid refresh policy '%s', expected one of: %s." % (
+                policy, ", ".join(REFRESH_POLICIES)))
+        return policy
+
+    def refresh_on_write(self, request=None):
+        """Whether every single write call must refresh the index."""
+        return self.get_refresh_policy(request) == REFRESH_ALWAYS
+
+    def after_write(self, request=None):
+        """
+        Called once all the writes of ``request`` are sent; refreshes the
+        index a single time under the ``request`` refresh policy and makes
+        the cached searches of the index stale.
+        """
+        if self.get_refresh_policy(request) == REFRESH_REQUEST:
+            self.client.indices.refresh(self._meta.index)
+
+        for cache in (self.get_search_cache(), self.get_aggregations_cache()):
+            if cache is not None:
+                cache.bump_generation(self._meta.index)
+
     def obj_create(self, bundle, request=None, **kwargs):
         bundle.obj = dict(kwargs)
         bundle = self.full_hydrate(bundle)
         pk = kwargs.get("pk", bundle.obj.get("_id"))
 
         result = self.client.index(self._meta.index, self._meta.doc_type, bundle.obj, 
-                                   id=pk, refresh=True)
+                                   id=pk, refresh=self.refresh_on_write(bundle.request))
+        self.after_write(bundle.request)
         result.update(bundle.obj)
         return result
     
@@ -262,22 +1139,434 @@ class ElasticsearchResource(Resource):
         bundle.obj = dict(kwargs)
         bundle = self.full_hydrate(bundle)
         pk = kwargs.get('pk', bundle.obj.get('_id'))
-        result = self.client.update(self._meta.index, self._meta.doc_type, 
-                                    bundle.obj, id=pk, refresh=True)
+        params = self.get_version_params(bundle.request)
+        try:
+            result = self.client.update(self._meta.index, self._meta.doc_type, pk,
+                                        body={"doc": bundle.obj},
+                                        refresh=self.refresh_on_write(bundle.request),
+                                        **params)
+        except elasticsearch.exceptions.ConflictError, exc:
+            if not params:
+                raise
+            raise self.precondition_failed(exc)
+        self.after_write(bundle.request)
         result.update(bundle.obj)
         return result
     
+    def obj_partial_update(self, bundle, request=None, **kwargs):
+        """
+        Sends ``bundle.data`` as a partial ``doc`` update of the document
+        ``pk``, without reading it first.
+
+        ``Meta.update_retry_on_conflict`` and ``Meta.update_detect_noop``
+        are passed on to the update. The ``If-Match`` version, if any, is
+        sent instead of ``retry_on_conflict``, which Elasticsearch does not
+        accept along with it, and gives a ``412`` when the document moved
+        on. With ``Meta.always_return_data`` the updated source is returned
+        under ``get``.
+        """
+        pk = kwargs.get('pk')
+        body = {
+            "doc": bundle.data,
+            "detect_noop": self._meta.update_detect_noop,
+        }
+
+        version = self.get_version_params(bundle.request)
+
+        params = dict(version)
+        if self._meta.update_retry_on_conflict and not version:
+            params["retry_on_conflict"] = self._meta.update_retry_on_conflict
+        if self._meta.always_return_data:
+            params["_source"] = "true"
+
+        try:
+            result = self.client.update(self._meta.index, self._meta.doc_type, id=pk,
+                                        body=body, refresh=self.refresh_on_write(bundle.request),
+                                        params=params)
+        except elasticsearch.exceptions.ConflictError, exc:
+            if not version:
+                raise
+            raise self.precondition_failed(exc)
+        self.after_write(bundle.request)
+        return result
+
+    def patch_detail(self, request, **kwargs):
+        """
+        Updates a resource in-place with the fields sent only.
+
+        Unlike ``Resource.patch_detail``, the document is neither fetched
+        nor fully hydrated: the fields are sent as they are, as a partial
+        update, by ``obj_partial_update``.
+        """
+        request = convert_post_to_patch(request)
+        deserialized = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        deserialized = self.alter_deserialized_detail_data(request, deserialized)
+        if not isinstance(deserialized, dict) or not deserialized:
+            raise BadRequest("Invalid data sent: expected the fields to update")
+
+        data = dict_strip_unicode_keys(deserialized)
+        data.pop("resource_uri", None)
+        data.pop("_id", None)
+
+        bundle = self.build_bundle(data=data, request=request)
+        kwargs = self.remove_api_resource_names(kwargs)
+
+        try:
+            result = self.obj_partial_update(bundle, **kwargs)
+        except elasticsearch.exceptions.NotFoundError, exc:
+            response = http.HttpNotFound("Not found", content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+        except elasticsearch.exceptions.ConflictError, exc:
+            response = http.HttpConflict(str(exc), content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+        except elasticsearch.exceptions.RequestError, exc:
+            response = http.HttpBadRequest(str(exc), content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+        except elasticsearch.exceptions.ElasticsearchException, exc:
+            msg = "%s(%s)" % (exc.__class__.__name__, exc)
+            response = http.HttpApplicationError(msg, content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+
+        if not self._meta.always_return_data:
+            response = http.HttpAccepted()
+        else:
+            obj = {"_id": result.get("_id", kwargs.get("pk")),
+                   "_source": result.get("get", {}).get("_source", {})}
+            bundle = self.full_dehydrate(self.build_bundle(obj=obj, request=request))
+            bundle = self.alter_detail_data_to_serialize(request, bundle)
+            response = self.create_response(request, bundle, response_class=http.HttpAccepted)
+
+        etag = self.get_etag(result)
+        if etag is not None:
+            response['ETag'] = etag
+        return response
+
     def obj_delete_list(self, request=None, **kwargs):
+        request = getattr(kwargs.get('bundle'), 'request', request)
         pk = kwargs.get('pk')
         query = request.body
         result = self.client.delete_by_query(self._meta.index, self._meta.doc_type, query)
+        # delete by query can not refresh by itself
+        if self.refresh_on_write(request):
+            self.client.indices.refresh(self._meta.index)
+        self.after_write(request)
         return result
 
     def obj_delete(self, request=None, **kwargs):
+        request = getattr(kwargs.get('bundle'), 'request', request)
         pk = kwargs.get('pk')
-        result = self.client.delete(self._meta.index, self._meta.doc_type, id=pk)
+        params = self.get_version_params(request)
+        try:
+            result = self.client.delete(self._meta.index, self._meta.doc_type, id=pk,
+                                        refresh=self.refresh_on_write(request),
+                                        **params)
+        except elasticsearch.exceptions.ConflictError, exc:
+            if not params:
+                raise
+            raise self.precondition_failed(exc)
+        self.after_write(request)
         return result
 
+    def get_bulk_writer(self, **params):
+        """
+        Returns a ``BulkWriter`` for this resource, chunking requests with
+        ``Meta.bulk_max_actions`` and ``Meta.bulk_max_bytes`` and sending
+        them over ``Meta.bulk_threads`` threads.
+        """
+        return BulkWriter(self.client, index=self._meta.index,
+                          doc_type=self._meta.doc_type,
+                          max_actions=self._meta.bulk_max_actions,
+                          max_bytes=self._meta.bulk_max_bytes,
+                          threads=self._meta.bulk_threads, **params)
+
+    def hydrate_bulk_line(self, request, data):
+        """
+        Returns the bulk ``(action, source)`` pair of a document sent to the
+        ``bulk/`` endpoint, or ``None`` to skip it.
+
+        Documents are indexed as they are, under their ``_id`` if any; no
+        Bundle is built. Override to validate or enrich them.
+        """
+        data.pop("resource_uri", None)
+        pk = data.pop("_id", None)
+        return {"index": {"_id": pk} if pk is not None else {}}, data
+
+    def post_bulk(self, request, **kwargs):
+        """
+        Indexes the documents of a newline delimited JSON request.
+
+        Lines are read as the request streams in, turned into bulk actions
+        by ``hydrate_bulk_line`` and sent in chunks by a ``BulkWriter``, so
+        memory use does not grow with the size of the request. A report is
+        streamed back for every chunk once it is written, listing the lines
+        that failed, followed by a summary of the whole request.
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        if 'post' not in self._meta.list_allowed_methods:
+            raise ImmediateHttpResponse(response=http.HttpMethodNotAllowed())
+
+        refresh = self.refresh_on_write(request)
+
+        # line numbers of the actions sent, in the order chunks are collected
+        numbers = deque()
+        # lines rejected before being sent, reported with the next chunk
+        failed = deque()
+        reports = []
+        # chunks collected, and the actions they hold
+        chunks = [0, 0]
+
+        def on_chunk(result):
+            items = result.get("items", [])
+            chunk_numbers = [numbers.popleft() for item in items]
+            chunks[1] += len(items)
+            last = chunk_numbers[-1] if chunk_numbers else 0
+
+            chunk_failed = []
+            while failed and failed[0]["line"] < last:
+                chunk_failed.append(failed.popleft())
+            for number, item in zip(chunk_numbers, items):
+                status = item.values()[0]
+                if "error" in status:
+                    chunk_failed.append({"line": number, "status": status.get("status"),
+                                         "error": status["error"]})
+            chunk_failed.sort(key=lambda failure: failure["line"])
+
+            chunks[0] += 1
+            reports.append({
+                "chunk": chunks[0],
+                "lines": [chunk_numbers[0], last] if chunk_numbers else [],
+                "took": result.get("took", 0),
+                "errors": bool(chunk_failed),
+                "failed": chunk_failed,
+            })
+
+        def results():
+            writer = self.get_bulk_writer(refresh=refresh, on_chunk=on_chunk,
+                                          keep_items=False)
+            summary = {"actions": 0, "took": 0, "errors": False}
+            try:
+                for number, line in enumerate(request, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        failed.append({"line": number, "error": "Invalid JSON document"})
+                        summary["errors"] = True
+                        continue
+                    if not isinstance(data, dict):
+                        failed.append({"line": number, "error": "Expected a JSON object"})
+                        summary["errors"] = True
+                        continue
+
+                    try:
+                        pair = self.hydrate_bulk_line(request, data)
+                    except BadRequest, exc:
+                        failed.append({"line": number, "error": str(exc)})
+                        summary["errors"] = True
+                        continue
+                    if pair is None:
+                        continue
+
+                    numbers.append(number)
+                    writer.add(*pair)
+                    while reports:
+                        yield json.dumps(reports.pop(0))
+
+                writer.close()
+            except elasticsearch.exceptions.ElasticsearchException, exc:
+                summary["error"] = str(exc)
+                # the lines of the failed chunk and of those never collected
+                reports.append({
+                    "chunk": chunks[0] + 1,
+                    "lines": [numbers[0], numbers[-1]] if numbers else [],
+                    "errors": True,
+                    "error": str(exc),
+                })
+            finally:
+                writer.terminate()
+                if writer.actions:
+                    self.after_write(request)
+
+            for report in reports:
+                yield json.dumps(report)
+            summary.update(actions=chunks[1], took=writer.took)
+            summary["errors"] = summary["errors"] or writer.errors or "error" in summary
+            if failed:
+                summary["failed"] = list(failed)
+            yield json.dumps(summary)
+
+        self.log_throttled_access(request)
+        return StreamingHttpResponse(ndjson_stream(results()), 
+                                     content_type=build_content_type('application/x-ndjson'))
+
+    def get_export(self, request, **kwargs):
+        """
+        Streams every hit of the list query through the scroll API.
+
+        Hits are written as newline delimited JSON, or as a JSON array with
+        ``format=json``, ``Meta.export_batch_size`` at a time, so memory
+        stays bounded whatever the number of hits. The scroll context is
+        cleared once the export ends or the client goes away.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        body = self.build_query(request)
+        body.pop("from", None)
+        body.pop("search_after", None)
+        body["size"] = self._meta.export_batch_size
+
+        scroll = self._meta.export_scroll
+        try:
+            result = self.client.search(self._meta.index, self._meta.doc_type,
+                                        body=body, scroll=scroll)
+        except Exception, exc:
+            response = http.HttpBadRequest(str(exc), content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+
+        state = {"scroll_id": result.get("_scroll_id")}
+
+        def hits(result):
+            while result["hits"]["hits"]:
+                for hit in result["hits"]["hits"]:
+                    yield hit
+                result = self.client.scroll(scroll_id=state["scroll_id"], scroll=scroll)
+                state["scroll_id"] = result.get("_scroll_id", state["scroll_id"])
+
+        def clear_scroll():
+            if state["scroll_id"]:
+                try:
+                    self.client.clear_scroll(scroll_id=state["scroll_id"])
+                except elasticsearch.exceptions.ElasticsearchException:
+                    # the context expires by itself anyway
+                    pass
+
+        items = (self.serialize(request, obj, 'application/json')
+                 for obj in self.iter_dehydrate_objects(request, hits(result)))
+
+        if request.GET.get("format") == "json":
+            content = json_array_stream(items)
+            content_type = 'application/json'
+        else:
+            content = ndjson_stream(items)
+            content_type = 'application/x-ndjson'
+
+        self.log_throttled_access(request)
+        return StreamingHttpResponse(ClosingIterator(content, clear_scroll),
+                                     content_type=build_content_type(content_type))
+
+    def get_query_params(self, descriptor):
+        """
+        Turns a query descriptor, a dict of list query parameters such as
+        ``{"limit": 5, "name__in": ["a", "b"]}``, into a ``QueryDict``.
+        """
+        if not isinstance(descriptor, dict):
+            raise BadRequest("Invalid query sent: %r" % (descriptor,))
+
+        params = QueryDict('', mutable=True)
+        for key, value in descriptor.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            params.setlist(key, [unicode(v) for v in values])
+        return params
+
+    def post_msearch(self, request, **kwargs):
+        """
+        Runs several list queries with a single multi-search request.
+
+        Takes ``{"queries": [{descriptor}, ...]}``, each descriptor holding
+        the query parameters of a list request (filters, ``offset``,
+        ``limit``, ``order_by``, ``fields``...). Returns ``{"results":
+        [...]}`` with a paginated list per query, in the same order; a query
+        that failed gets ``{"error": ...}`` instead.
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        deserialized = self.deserialize(request, request.body, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        queries = deserialized.get("queries") if isinstance(deserialized, dict) else None
+        if not isinstance(queries, list) or not queries:
+            raise BadRequest("Invalid data sent: missing 'queries'")
+
+        params_list = [self.get_query_params(descriptor) for descriptor in queries]
+        bodies = [self.build_query(request, params, count_only=self.is_count_only(params))
+                  for params in params_list]
+
+        lines = []
+        for body in bodies:
+            lines.append({})
+            lines.append(body)
+
+        try:
+            result = self.client.msearch(lines, index=self._meta.index,
+                                         doc_type=self._meta.doc_type)
+        except Exception, exc:
+            response = http.HttpBadRequest(str(exc), content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+
+        collection_name = self._meta.collection_name
+        results = []
+        for params, body, response in zip(params_list, bodies, result["responses"]):
+            if "error" in response:
+                results.append({"error": response["error"]})
+                continue
+
+            objects = ElasticsearchResult(response, dict(body=body))
+            paginator = self._meta.paginator_class(params, objects, 
+                resource_uri=self.get_resource_uri(), limit=self._meta.limit, 
+                max_limit=self._meta.max_limit, collection_name=collection_name,
+                count_only=self.is_count_only(params))
+            page = paginator.page()
+            page[collection_name] = self.dehydrate_objects(request, page[collection_name])
+            results.append(page)
+
+        self.log_throttled_access(request)
+        return self.create_response(request, {"results": results})
+
+    def get_aggregations(self, request, **kwargs):
+        """
+        Returns the ``Meta.aggregations`` of the list query, without hits.
+
+        The search runs with ``size=0`` and its result is cached through
+        ``Meta.aggregations_cache``, apart from the list searches, until
+        the next write.
+        """
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        if not self._meta.aggregations:
+            return http.HttpNotFound()
+
+        body = self.build_query(request)
+        for key in ("from", "sort", "search_after", "_source"):
+            body.pop(key, None)
+        body["size"] = 0
+
+        try:
+            result = self.cached_search(self.get_aggregations_cache(), body)
+        except Exception, exc:
+            response = http.HttpBadRequest(str(exc), content_type="text/plain")
+            raise ImmediateHttpResponse(response)
+
+        object_list = {
+            'meta': {
+                'took': result["took"],
+                'total_count': result["hits"]["total"],
+                'aggregations': result.get("aggregations", {}),
+            },
+        }
+
+        self.log_throttled_access(request)
+        return self.create_response(request, object_list)
+
     def get_percolate(self, request, **kwargs):
         """ Percolate call """
         self.method_check(request, allowed=['post'])
@@ -294,6 +1583,88 @@ class ElasticsearchResource(Resource):
         self.log_throttled_access(request)
         return self.create_response(request, object_list)
 
+    def post_percolate_bulk(self, request, **kwargs):
+        """
+        Percolates a batch of documents.
+
+        Takes a JSON array of documents or, with an ``application/x-ndjson``
+        content type, one document per line, read as the request streams
+        in. Documents are sent ``Meta.percolate_chunk_size`` at a time with
+        multi-percolate requests. The response of every document, holding
+        its ``matches``, or its ``error``, is streamed back in order as
+        newline delimited JSON, or as a JSON array with ``format=json``.
+        """
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        ndjson = request.META.get('CONTENT_TYPE', '').startswith('application/x-ndjson')
+        if ndjson:
+            documents = ndjson_lines(request)
+        else:
+            try:
+                documents = json.loads(request.body)
+            except ValueError:
+                raise BadRequest("Invalid data sent: expected a JSON array of documents")
+            if not isinstance(documents, list):
+                raise BadRequest("Invalid data sent: expected a JSON array of documents")
+
+        header = json.dumps({"percolate": {"index": self._meta.index,
+                                           "type": self._meta.doc_type}})
+
+        def percolate(chunk):
+            lines = []
+            errors = {}
+            for i, doc in enumerate(chunk):
+                if ndjson:
+                    try:
+                        doc = json.loads(doc)
+                    except ValueError:
+                        errors[i] = {"error": "Invalid JSON document"}
+                        continue
+                lines.append(header)
+                lines.append(json.dumps({"doc": doc}))
+
+            count = len(lines) / 2
+            responses = []
+            if lines:
+                try:
+                    result = self.client.mpercolate("\n".join(lines) + "\n",
+                                                    index=self._meta.index,
+                                                    doc_type=self._meta.doc_type)
+                    responses = list(result.get("responses") or [])[:count]
+                except elasticsearch.exceptions.ElasticsearchException, exc:
+                    responses = [{"error": str(exc)}] * count
+
+            # a short reply must not shift the responses of later documents
+            missing = {"error": "No response from the multi-percolate request"}
+            responses.extend([missing] * (count - len(responses)))
+
+            responses = iter(responses)
+            for i in range(len(chunk)):
+                yield errors[i] if i in errors else responses.next()
+
+        def results(documents):
+            documents = iter(documents)
+            size = self._meta.percolate_chunk_size
+            while True:
+                chunk = list(islice(documents, size))
+                if not chunk:
+                    break
+                for response in percolate(chunk):
+                    yield json.dumps(response)
+
+        if request.GET.get("format") == "json":
+            content = json_array_stream(results(documents))
+            content_type = 'application/json'
+        else:
+            content = ndjson_stream(results(documents))
+            content_type = 'application/x-ndjson'
+
+        self.log_throttled_access(request)
+        return StreamingHttpResponse(content, 
+                                     content_type=build_content_type(content_type))
+
     def patch_list(self, request, **kwargs):
         """
         Updates a collection in-place.
@@ -335,6 +1706,10 @@ class ElasticsearchResource(Resource):
 
             * ``PATCH`` is all or nothing. If a single sub-operation fails, the
               entire request will fail and all resources will be rolled back.
+              Every object is hydrated before anything is sent, so invalid
+              data writes nothing; Elasticsearch bulk requests are not
+              transactional though, so a chunk rejected by Elasticsearch
+              does not undo the chunks written before it.
 
           * For ``PATCH`` to work, you **must** have ``put`` in your
             :ref:`detail-allowed-methods` setting.
@@ -358,41 +1733,60 @@ class ElasticsearchResource(Resource):
         if len(deserialized[collection_name]) and 'put' not in self._meta.detail_allowed_methods:
             raise ImmediateHttpResponse(response=http.HttpMethodNotAllowed())
 
-        bulk_commands = []
-        
+        deleted_collection = deserialized.get(deleted_collection_name, [])
+
+        if deleted_collection and 'delete' not in self._meta.detail_allowed_methods:
+            raise ImmediateHttpResponse(response=http.HttpMethodNotAllowed())
+
+        # Resolve every resource URI up front, so the existing documents are
+        # fetched with a few multi-get requests instead of one get each.
+        uris = [data["resource_uri"] for data in deserialized[collection_name]
+                if "resource_uri" in data]
+        uris.extend(deleted_collection)
+
+        uri_pks = dict((uri, self.get_pk_via_uri(uri)) for uri in uris)
+        existing = self.mget_objects(uri_pks.values())
+
+        # Deletes are checked before anything is written, since chunks are
+        # sent to Elasticsearch as soon as they fill up.
+        for uri in deleted_collection:
+            if uri_pks[uri] not in existing:
+                response = http.HttpNotFound("Not found", content_type="text/plain")
+                raise ImmediateHttpResponse(response)
+
+        # Every object is hydrated before the first chunk is sent, so a
+        # hydration error leaves the index untouched.
+        actions = []
         bundles_seen = []
 
-        def index(bundle, command='index'):
-            command = {command:{'_id':bundle.data["_id"]}}
-            bulk_commands.append(command)
-            command = bundle.obj
-            bulk_commands.append(command)
+        def index(bundle, pk=None, command='index'):
+            if pk is None:
+                pk = bundle.data.get("_id")
+            command = {command:{'_id':pk} if pk is not None else {}}
+            actions.append((command, bundle.obj))
 
         for data in deserialized[collection_name]:
             # If there's a resource_uri then this is either an
             # update-in-place or a create-via-PUT.
             if "resource_uri" in data:
-                try:
-                    uri = data.pop('resource_uri')
-
-                    obj = self.get_via_uri(uri, request=request)
+                uri = data.pop('resource_uri')
+                pk = uri_pks[uri]
 
+                if pk in existing:
                     # The object does exist, so this is an update-in-place.
-                    bundle = self.build_bundle(obj=obj['_source'], request=request)
+                    bundle = self.build_bundle(obj=existing[pk]['_source'], request=request)
                     bundle.data.update(data)
                     bundle = self.full_hydrate(bundle)
 
-                    bulk_commands.append({'update':{'_id':bundle.data["_id"]}})
-                    bulk_commands.append({'doc':bundle.obj})
-                    
-                except (ObjectDoesNotExist, MultipleObjectsReturned):
+                    actions.append(({'update':{'_id':pk}}, {'doc':bundle.obj}))
+                else:
                     # The object referenced by resource_uri doesn't exist,
                     # so this is a create-by-PUT equivalent.
                     data = self.alter_deserialized_detail_data(request, data)
                     bundle = self.build_bundle(data=dict_strip_unicode_keys(data), request=request)
                     #self.obj_create(bundle=bundle)
                     bundle = self.full_hydrate(bundle)
-                    index(bundle)
+                    index(bundle, pk)
             else:
                 # There's no resource URI, so this is a create call just
                 # like a POST to the list resource.
@@ -402,37 +1796,37 @@ class ElasticsearchResource(Resource):
                 bundle = self.full_hydrate(bundle)
                 index(bundle)
 
-            bundles_seen.append(bundle)
+            if self._meta.always_return_data:
+                bundles_seen.append(bundle)
 
-        deleted_collection = deserialized.get(deleted_collection_name, [])
+        for uri in deleted_collection:
+            #self.obj_delete(bundle=bundle)
+            actions.append(({"delete":{'_id':uri_pks[uri]}}, None))
 
-        if deleted_collection:
-            if 'delete' not in self._meta.detail_allowed_methods:
-                raise ImmediateHttpResponse(response=http.HttpMethodNotAllowed())
+        if not actions:
+            return http.HttpBadRequest()
 
-            for uri in deleted_collection:
-                obj = self.get_via_uri(uri, request=request)
-                bundle = self.build_bundle(obj=obj['_source'], request=request)
-                #self.obj_delete(bundle=bundle)
-                command = {"delete":{'_id':bundle['pk']}}
-                bulk_commands.append(command)
+        refresh = self.refresh_on_write(request)
 
-        if len(bulk_commands):
+        with self.get_bulk_writer(refresh=refresh) as writer:
             try:
-                result = self.client.bulk(bulk_commands, refresh=True,
-                                          index=self._meta.index, 
-                                          doc_type=self._meta.doc_type)
-            except Exception, exc:
+                for action, source in actions:
+                    writer.add(action, source)
+
+                result = writer.close()
+            except elasticsearch.exceptions.ElasticsearchException, exc:
                 response = http.HttpBadRequest(str(exc), content_type="text/plain")
                 raise ImmediateHttpResponse(response)
-            else:
-                if not self._meta.always_return_data:
-                    return http.HttpAccepted(json.dumps(result))
-                else:
-                    to_be_serialized = {}
-                    to_be_serialized['objects'] = [self.full_dehydrate(bundle, for_list=True) for bundle in bundles_seen]
-                    to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
-                    return self.create_response(request, to_be_serialized, response_class=http.HttpAccepted)
+            finally:
+                # the chunks sent before a failure are written all the same
+                if writer.actions:
+                    self.after_write(request)
+
+        if not self._meta.always_return_data:
+            return http.HttpAccepted(json.dumps(result))
         else:
-            return http.HttpBadRequest()
+            to_be_serialized = {}
+            to_be_serialized['objects'] = [self.full_dehydrate(bundle, for_list=True) for bundle in bundles_seen]
+            to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+            return self.create_response(request, to_be_serialized, response_class=http.HttpAccepted)
 
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for streamed requests and responses
+
+"""
+
+try:
+    from django.http import StreamingHttpResponse
+except ImportError: # Django < 1.5
+    from django.http import HttpResponse as StreamingHttpResponse
+
+
+def json_object_stream(head, name, items):
+    """
+    Yields the JSON text of the serialized object ``head`` with an extra
+    ``name`` member holding the array of the JSON texts in ``items``.
+    """
+    head = head.rstrip()[:-1].rstrip()
+    if head == "{":
+        yield '{"%s": [' % name
+    else:
+        yield '%s, "%s": [' % (head, name)
+
+    for i, item in enumerate(items):
+        if i:
+            yield ", "
+        yield item
+    yield "]}"
+
+
+def json_array_stream(items):
+    """Yields the JSON array of the JSON texts in ``items``."""
+    yield "["
+    for i, item in enumerate(items):
+        if i:
+            yield ", "
+        yield item
+    yield "]"
+
+
+def ndjson_stream(items):
+    """Yields the JSON texts in ``items`` as newline delimited JSON."""
+    for item in items:
+        yield item + "\n"
+
+
+def ndjson_lines(lines):
+    """
+    Yields the non blank lines of newline delimited JSON read from
+    ``lines``, e.g. a request, without decoding them.
+    """
+    for line in lines:
+        line = line.strip()
+        if line:
+            yield line
+
+
+class ClosingIterator(object):
+    """
+    Wraps ``iterable`` and calls ``close`` once, either when it is exhausted
+    or when the response is closed, e.g. because the client went away.
+    """
+
+    def __init__(self, iterable, close):
+        self._iterator = iter(iterable)
+        self._close = close
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return self._iterator.next()
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        if self._close is not None:
+            close, self._close = self._close, None
+            close()
@@ -3,6 +3,7 @@ from django.conf import settings
 from tastypie import fields
 from tastypie.authentication import Authentication
 from tastypie.authorization import DjangoAuthorization
+from tastypie.constants import ALL
 
 from tastypie_elasticsearch import resources
 
@@ -18,6 +19,11 @@ class TestResource(resources.ElasticsearchResource):
         authentication = Authentication()
         authorization = DjangoAuthorization()
         
+        filtering = {
+            'number': ALL,
+            'name': ['match'],
+        }
+
         create_if_missing = True
         index_settings = {
             'settings': {
@@ -34,3 +40,19 @@ class TestResource(resources.ElasticsearchResource):
     def determine_format(self, request):
         return "application/json"
 
+
+class CursorTestResource(resources.ElasticsearchResource):
+
+    class Meta:
+        resource_name = 'cursor'
+
+        index = "test"
+        doc_type = "test"
+
+        authentication = Authentication()
+        authorization = DjangoAuthorization()
+
+        cursor_pagination = True
+
+    def determine_format(self, request):
+        return "application/json"
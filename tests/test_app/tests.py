@@ -1,23 +1,35 @@
-from __future__ import with_statement
+from __future__ import absolute_import, with_statement
 
 import urlparse
+import unittest
+import threading
+import time
+
+import mock
 
 from django.core import exceptions, urlresolvers
 from django.test import client, utils
 from django.utils import simplejson as json
 
 from tastypie import authorization as tastypie_authorization
+from tastypie import exceptions as tastypie_exceptions
+from tastypie import fields as tastypie_fields
 from tastypie.test import ResourceTestCase, TestApiClient
 
+from tastypie_elasticsearch import connections, rawjson
 from tastypie_elasticsearch import resources as tastypie_elasticsearch_resources
+from tastypie_elasticsearch.bulk import BulkWriter
+from tastypie_elasticsearch.cache import LocalCache, SearchCache
+from tastypie_elasticsearch.conditional import parse_etags, etag_matches
+from tastypie_elasticsearch.paginator import ElasticsearchResult
+from tastypie_elasticsearch.rawjson import split_search_response
+from tastypie_elasticsearch.singleflight import SingleFlight
 
 import elasticsearch
 
-import resources
+from tests import urls
+from tests.test_app import resources
 
-# TODO: Test set operations
-# TODO: Test bulk operations
-# TODO: Test ordering, filtering
 # TODO: Use Tastypie's testcase class for tests?
 
 @utils.override_settings(DEBUG=True)
@@ -50,6 +62,11 @@ class TastypieElasticsearchTest(ResourceTestCase):
         return urlresolvers.reverse('api_dispatch_detail', kwargs={'api_name': self.api_name, 
             'resource_name': resource_name, 'pk': resource_pk})
     
+    def responseContent(self, response):
+        if getattr(response, 'streaming', False):
+            return ''.join(response.streaming_content)
+        return response.content
+
     def fullURItoAbsoluteURI(self, uri):
         scheme, netloc, path, query, fragment = urlparse.urlsplit(uri)
         return urlparse.urlunsplit((None, None, path, query, fragment))
@@ -107,6 +124,23 @@ class BasicTest(TastypieElasticsearchTest):
         self.assertHttpNotFound(response)
         
     
+    def test_get_multiple(self):
+        resource_name = 'test'
+        base_url = self.resourceListURI(resource_name)
+
+        for i in range(3):
+            obj = dict(_id=i + 1, first_name="Person %d" % (i + 1))
+            response = self.api_client.post(base_url, format="json", data=obj)
+            self.assertHttpCreated(response)
+
+        response = self.api_client.get(base_url + 'set/3;404;1/')
+        self.assertHttpOK(response)
+
+        data = json.loads(response.content)
+        self.assertEqual([obj['first_name'] for obj in data['objects']],
+                         ["Person 3", "Person 1"])
+        self.assertEqual(data['not_found'], ["404"])
+
     def test_bulk(self):
         resource_name = 'test'
         base_url = self.resourceListURI(resource_name)
@@ -148,6 +182,180 @@ class BasicTest(TastypieElasticsearchTest):
         response = self.api_client.patch(base_url, format="json", data=data)
         self.assertHttpAccepted(response)
 
+    def test_bulk_resource_uris(self):
+        resource_name = 'test'
+        base_url = self.resourceListURI(resource_name)
+
+        for i in range(2):
+            obj = dict(_id=i + 1, first_name="Person %d" % (i + 1))
+            response = self.api_client.post(base_url, format="json", data=obj)
+            self.assertHttpCreated(response)
+
+        data = {
+            "objects": [
+                # update-in-place
+                {"resource_uri": self.resourceDetailURI(resource_name, 1),
+                 "last_name": "Updated"},
+                # create-via-PUT
+                {"resource_uri": self.resourceDetailURI(resource_name, 3),
+                 "first_name": "Person 3"},
+            ],
+            "deleted_objects": [self.resourceDetailURI(resource_name, 2)],
+        }
+        response = self.api_client.patch(base_url, format="json", data=data)
+        self.assertHttpAccepted(response)
+
+        data = json.loads(self.api_client.get(base_url + 'set/1;2;3/').content)
+        self.assertEqual(data['not_found'], ["2"])
+        self.assertEqual(data['objects'][0]['first_name'], "Person 1")
+        self.assertEqual(data['objects'][0]['last_name'], "Updated")
+        self.assertEqual(data['objects'][1]['first_name'], "Person 3")
+
+    def test_bulk_hydration_error(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        full_hydrate = resource.full_hydrate
+        def hydrate(bundle):
+            if bundle.data.get("number") == 2:
+                raise tastypie_exceptions.BadRequest("Invalid number")
+            return full_hydrate(bundle)
+
+        data = {"objects": [{"_id": 1, "number": 1}, {"_id": 2, "number": 2}]}
+        max_actions = resource._meta.bulk_max_actions
+        resource._meta.bulk_max_actions = 1
+        try:
+            with mock.patch.object(resource, 'full_hydrate', side_effect=hydrate):
+                response = self.api_client.patch(base_url, format="json", data=data)
+            self.assertHttpBadRequest(response)
+        finally:
+            resource._meta.bulk_max_actions = max_actions
+
+        # the first object was not written before the second one failed
+        response = self.api_client.get(base_url + 'set/1/')
+        self.assertEqual(json.loads(response.content)['not_found'], ["1"])
+
+    def test_bulk_chunk_error(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        data = {"objects": [{"_id": 1, "number": 1}, {"_id": 2, "number": 2}]}
+        send = BulkWriter.send
+        calls = []
+        def fail_second(writer, body):
+            calls.append(body)
+            if len(calls) > 1:
+                raise elasticsearch.exceptions.TransportError(500, "failed")
+            return send(writer, body)
+
+        max_actions = resource._meta.bulk_max_actions
+        resource._meta.bulk_max_actions = 1
+        try:
+            with mock.patch.object(BulkWriter, 'send', fail_second):
+                with mock.patch.object(resource, 'after_write') as after_write:
+                    response = self.api_client.patch(base_url, format="json", data=data)
+            self.assertHttpBadRequest(response)
+            self.assertEqual(after_write.call_count, 1)
+        finally:
+            resource._meta.bulk_max_actions = max_actions
+
+    def test_refresh_policy(self):
+        resource_name = 'test'
+        base_url = self.resourceListURI(resource_name)
+
+        obj = dict(_id=1, first_name="John")
+        response = self.api_client.post(base_url + '?refresh=invalid',
+                                         format="json", data=obj)
+        self.assertHttpBadRequest(response)
+
+        response = self.api_client.post(base_url + '?refresh=request',
+                                         format="json", data=obj)
+        self.assertHttpCreated(response)
+
+        response = self.api_client.get(base_url)
+        self.assertEqual(len(json.loads(response.content)["objects"]), 1)
+
+    def test_schema_mapping_cache(self):
+        resource_name = 'test'
+        base_url = self.resourceListURI(resource_name)
+
+        response = self.api_client.post(base_url, format="json",
+                                         data=dict(first_name="John"))
+        self.assertHttpCreated(response)
+
+        response = self.api_client.get(base_url + 'schema/')
+        self.assertHttpOK(response)
+        self.assertFalse("nickname" in json.loads(response.content)["fields"])
+
+        resource = urls.v1_api._registry[resource_name]
+        resource.put_mapping({"test": {"properties": {"nickname": {"type": "string"}}}})
+
+        response = self.api_client.get(base_url + 'schema/')
+        self.assertTrue("nickname" in json.loads(response.content)["fields"])
+
+    def test_raw_json(self):
+        resource_name = 'test'
+        base_url = self.resourceListURI(resource_name)
+
+        for i in range(3):
+            obj = dict(_id=i + 1, name="Person %d" % (i + 1), number=i + 1)
+            response = self.api_client.post(base_url, format="json", data=obj)
+            self.assertHttpCreated(response)
+
+        expected = json.loads(self.api_client.get(base_url,
+            data={'order_by': 'number'}).content)
+
+        resource = urls.v1_api._registry[resource_name]
+        resource._meta.raw_json = True
+        try:
+            response = self.api_client.get(base_url, data={'order_by': 'number'})
+        finally:
+            resource._meta.raw_json = False
+        self.assertHttpOK(response)
+
+        data = json.loads(self.responseContent(response))
+        self.assertEqual(data['objects'], expected['objects'])
+        self.assertEqual(data['meta']['total_count'], 3)
+
+        # raw searches go through the search cache as well
+        resource._meta.raw_json = True
+        resource._meta.search_cache = 'local'
+        try:
+            with mock.patch.object(resource, 'send_raw_search',
+                                   wraps=resource.send_raw_search) as send:
+                for i in range(2):
+                    response = self.api_client.get(base_url, data={'order_by': 'number'})
+                    data = json.loads(self.responseContent(response))
+                    self.assertEqual(data['objects'], expected['objects'])
+                self.assertEqual(send.call_count, 1)
+        finally:
+            resource._meta.raw_json = False
+            resource._meta.search_cache = None
+            resource._search_cache = None
+
+    def test_stream_list(self):
+        base_url = self.resourceListURI('test')
+
+        for i in range(3):
+            obj = dict(_id=i + 1, name="Person %d" % (i + 1), number=i + 1)
+            response = self.api_client.post(base_url, format="json", data=obj)
+            self.assertHttpCreated(response)
+
+        expected = json.loads(self.api_client.get(base_url,
+            data={'order_by': 'number'}).content)
+
+        resource = urls.v1_api._registry['test']
+        resource._meta.stream_list = True
+        try:
+            response = self.api_client.get(base_url, data={'order_by': 'number'})
+            self.assertHttpOK(response)
+            data = json.loads(self.responseContent(response))
+        finally:
+            resource._meta.stream_list = False
+
+        self.assertEqual(data['objects'], expected['objects'])
+        self.assertEqual(data['meta']['total_count'], 3)
+
     def test_ordering(self):
         resource_name = 'test'
         base_url = self.resourceListURI(resource_name)
@@ -228,6 +436,478 @@ class BasicTest(TastypieElasticsearchTest):
             data={'offset': offset, 'limit': -7, "order_by": "number"})
         self.assertEqual(response.status_code, 400)
     
+    def test_cursor_pagination(self):
+        base_url = self.resourceListURI('test')
+
+        for i in range(10):
+            response = self.api_client.post(base_url,
+                format="json", data=dict(name="Person %d" % (i + 1), number=i+1))
+            self.assertHttpCreated(response)
+
+        numbers = []
+        url = self.resourceListURI('cursor') + '?limit=3&order_by=number'
+        while url:
+            response = self.api_client.get(url)
+            self.assertHttpOK(response)
+
+            data = json.loads(response.content)
+            self.assertEqual(data['meta']['total_count'], 10)
+            self.assertTrue(data['meta']['previous'] is None)
+
+            numbers.extend(obj['number'] for obj in data['objects'])
+            url = data['meta']['next']
+
+        self.assertEqual(numbers, range(1, 11))
+
+        response = self.api_client.get(self.resourceListURI('cursor'),
+                                       data={'cursor': 'invalid'})
+        self.assertHttpBadRequest(response)
+
+    def test_export(self):
+        base_url = self.resourceListURI('test')
+
+        for i in range(10):
+            response = self.api_client.post(base_url,
+                format="json", data=dict(name="Person %d" % (i + 1), number=i+1))
+            self.assertHttpCreated(response)
+
+        response = self.api_client.get(base_url + 'export/', data={'limit': 2})
+        self.assertHttpOK(response)
+        lines = self.responseContent(response).splitlines()
+        self.assertEqual(sorted(json.loads(line)['number'] for line in lines),
+                         range(1, 11))
+
+        response = self.api_client.get(base_url + 'export/', data={'format': 'json'})
+        self.assertHttpOK(response)
+        self.assertEqual(len(json.loads(self.responseContent(response))), 10)
+
+        # the export is not a count, whatever the list limit
+        response = self.api_client.get(base_url + 'export/', data={'limit': 0})
+        self.assertHttpOK(response)
+        lines = self.responseContent(response).splitlines()
+        self.assertEqual(sorted(json.loads(line)['number'] for line in lines),
+                         range(1, 11))
+
+    def test_filtering(self):
+        base_url = self.resourceListURI('test')
+
+        for i in range(10):
+            response = self.api_client.post(base_url,
+                format="json", data=dict(name="Person %d" % (i + 1), number=i+1))
+            self.assertHttpCreated(response)
+
+        def numbers(**filters):
+            filters['order_by'] = 'number'
+            response = self.api_client.get(base_url, data=filters)
+            self.assertHttpOK(response)
+            return [obj['number'] for obj in json.loads(response.content)['objects']]
+
+        self.assertEqual(numbers(number=3), [3])
+        self.assertEqual(numbers(number__in="2,4"), [2, 4])
+        self.assertEqual(numbers(number__gte=3, number__lt=6), [3, 4, 5])
+        self.assertEqual(numbers(number__range="8,9"), [8, 9])
+        self.assertEqual(numbers(number__exists="false"), [])
+        self.assertEqual(numbers(q="number:7"), [7])
+        self.assertEqual(numbers(unknown="ignored", limit=2), [1, 2])
+
+        response = self.api_client.get(base_url, data={'name__prefix': 'Person'})
+        self.assertHttpBadRequest(response)
+
+    def test_msearch(self):
+        base_url = self.resourceListURI('test')
+
+        for i in range(10):
+            response = self.api_client.post(base_url,
+                format="json", data=dict(name="Person %d" % (i + 1), number=i+1))
+            self.assertHttpCreated(response)
+
+        queries = [
+            {"number__lte": 3, "order_by": "number"},
+            {"number__in": [8, 9], "order_by": "-number", "limit": 1},
+        ]
+        response = self.api_client.post(base_url + 'msearch/', format="json",
+                                        data={"queries": queries})
+        self.assertHttpOK(response)
+
+        results = json.loads(response.content)['results']
+        self.assertEqual(len(results), 2)
+        self.assertEqual([obj['number'] for obj in results[0]['objects']], [1, 2, 3])
+        self.assertEqual(results[0]['meta']['total_count'], 3)
+        self.assertEqual([obj['number'] for obj in results[1]['objects']], [9])
+        self.assertEqual(results[1]['meta']['total_count'], 2)
+        self.assertTrue(results[1]['meta']['next'])
+
+        response = self.api_client.post(base_url + 'msearch/', format="json", data={})
+        self.assertHttpBadRequest(response)
+
+    def test_aggregations(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        response = self.api_client.get(base_url + 'aggregations/')
+        self.assertHttpNotFound(response)
+
+        for i in range(10):
+            response = self.api_client.post(base_url,
+                format="json", data=dict(name="Person %d" % (i + 1), number=i+1))
+            self.assertHttpCreated(response)
+
+        resource._meta.aggregations = {"numbers": {"stats": {"field": "number"}}}
+        resource._meta.aggregations_cache = 'local'
+        try:
+            response = self.api_client.get(base_url, data={'number__lte': 5})
+            self.assertHttpOK(response)
+            meta = json.loads(response.content)['meta']
+            self.assertEqual(meta['aggregations']['numbers']['max'], 5)
+
+            with mock.patch.object(resource.client, 'search',
+                                   wraps=resource.client.search) as search:
+                for i in range(2):
+                    response = self.api_client.get(base_url + 'aggregations/',
+                                                   data={'number__gt': 5})
+                    self.assertHttpOK(response)
+                    result = json.loads(response.content)
+                    self.assertEqual(result['meta']['total_count'], 5)
+                    self.assertEqual(result['meta']['aggregations']['numbers']['count'], 5)
+                    self.assertFalse('objects' in result)
+                self.assertEqual(search.call_count, 1)
+                self.assertEqual(search.call_args[1]['body']['size'], 0)
+
+                response = self.api_client.post(base_url,
+                    format="json", data=dict(name="Person 11", number=11))
+                self.assertHttpCreated(response)
+
+                response = self.api_client.get(base_url + 'aggregations/',
+                                               data={'number__gt': 5})
+                result = json.loads(response.content)
+                self.assertEqual(result['meta']['aggregations']['numbers']['count'], 6)
+                self.assertEqual(search.call_count, 2)
+
+            # limit=0 counts lists only, the aggregations are still computed
+            response = self.api_client.get(base_url + 'aggregations/',
+                                           data={'number__lte': 5, 'limit': 0})
+            self.assertHttpOK(response)
+            result = json.loads(response.content)
+            self.assertEqual(result['meta']['aggregations']['numbers']['count'], 5)
+        finally:
+            resource._meta.aggregations = None
+            resource._meta.aggregations_cache = None
+            resource._aggregations_cache = None
+
+    def test_bulk_ndjson(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        lines = [json.dumps(dict(_id=i + 1, name="Person %d" % (i + 1), number=i + 1))
+                 for i in range(5)]
+        lines.insert(2, "not json")
+        lines.extend(["[1, 2]", "42"])
+        body = "\n".join(lines) + "\n"
+
+        max_actions = resource._meta.bulk_max_actions
+        resource._meta.bulk_max_actions = 2
+        try:
+            response = self.client.post(base_url + 'bulk/', data=body,
+                                        content_type='application/x-ndjson')
+            self.assertHttpOK(response)
+            reports = [json.loads(line) for line in
+                       self.responseContent(response).splitlines()]
+        finally:
+            resource._meta.bulk_max_actions = max_actions
+
+        summary = reports.pop()
+        self.assertEqual(summary["actions"], 5)
+        self.assertTrue(summary["errors"])
+        self.assertEqual([report["lines"] for report in reports], [[1, 2], [4, 5], [6, 6]])
+        self.assertEqual(reports[1]["failed"], [{"line": 3, "error": "Invalid JSON document"}])
+        # valid JSON that is not an object is rejected too, after the last chunk
+        self.assertEqual(summary["failed"], [{"line": 7, "error": "Expected a JSON object"},
+                                             {"line": 8, "error": "Expected a JSON object"}])
+
+        response = self.api_client.get(base_url, data={'order_by': 'number'})
+        self.assertEqual([obj['number'] for obj in json.loads(response.content)['objects']],
+                         [1, 2, 3, 4, 5])
+
+    def test_bulk_ndjson_chunk_error(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        body = "".join(json.dumps(dict(_id=i + 1, number=i + 1)) + "\n" for i in range(5))
+        send = BulkWriter.send
+        calls = []
+        def fail_second(writer, body):
+            calls.append(body)
+            if len(calls) > 1:
+                raise elasticsearch.exceptions.TransportError(500, "failed")
+            return send(writer, body)
+
+        max_actions = resource._meta.bulk_max_actions
+        resource._meta.bulk_max_actions = 2
+        try:
+            with mock.patch.object(BulkWriter, 'send', fail_second):
+                response = self.client.post(base_url + 'bulk/', data=body,
+                                            content_type='application/x-ndjson')
+                reports = [json.loads(line) for line in
+                           self.responseContent(response).splitlines()]
+        finally:
+            resource._meta.bulk_max_actions = max_actions
+
+        summary = reports.pop()
+        # only the first chunk was written
+        self.assertEqual(summary["actions"], 2)
+        self.assertTrue(summary["errors"])
+        self.assertTrue("error" in summary)
+        self.assertEqual([report["lines"] for report in reports], [[1, 2], [3, 5]])
+        self.assertTrue("error" in reports[1])
+
+    def test_patch_detail(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        obj = dict(_id=1, name="Person 1", number=1, blob="x" * 1000)
+        response = self.api_client.post(base_url, format="json", data=obj)
+        self.assertHttpCreated(response)
+
+        with mock.patch.object(resource.client, 'get') as get:
+            response = self.api_client.patch(self.resourceDetailURI('test', 1),
+                format="json", data={"number": 2, "resource_uri": "ignored"})
+            self.assertHttpAccepted(response)
+            self.assertFalse(get.called)
+
+        response = self.api_client.get(self.resourceDetailURI('test', 1))
+        obj = json.loads(response.content)
+        self.assertEqual(obj['number'], 2)
+        self.assertEqual(obj['name'], "Person 1")
+        self.assertEqual(len(obj['blob']), 1000)
+
+        response = self.api_client.patch(self.resourceDetailURI('test', 2),
+            format="json", data={"number": 2})
+        self.assertHttpNotFound(response)
+
+        failures = [
+            (elasticsearch.exceptions.RequestError(400, "mapper_parsing_exception", {}), 400),
+            (elasticsearch.exceptions.ConnectionError("N/A", "refused", None), 500),
+            (elasticsearch.exceptions.ConnectionTimeout("TIMEOUT", "timed out", None), 500),
+        ]
+        for exc, status_code in failures:
+            with mock.patch.object(resource.client, 'update', side_effect=exc):
+                response = self.api_client.patch(self.resourceDetailURI('test', 1),
+                    format="json", data={"number": 3})
+            self.assertEqual(response.status_code, status_code)
+
+    def test_versions(self):
+        base_url = self.resourceListURI('test')
+        detail_url = self.resourceDetailURI('test', 1)
+
+        response = self.api_client.post(base_url, format="json",
+                                        data=dict(_id=1, name="Person 1", number=1))
+        self.assertHttpCreated(response)
+
+        response = self.api_client.get(detail_url)
+        self.assertHttpOK(response)
+        etag = response['ETag']
+        self.assertEqual(etag, '"1"')
+
+        response = self.api_client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.api_client.patch(detail_url, format="json", data={"number": 2},
+                                         HTTP_IF_MATCH=etag)
+        self.assertHttpAccepted(response)
+        self.assertEqual(response['ETag'], '"2"')
+
+        # the document moved on since the first version
+        response = self.api_client.patch(detail_url, format="json", data={"number": 3},
+                                         HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+        response = self.api_client.delete(detail_url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+
+        response = self.api_client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertHttpOK(response)
+        self.assertEqual(json.loads(response.content)['number'], 2)
+
+        resource = urls.v1_api._registry['test']
+        resource._meta.update_retry_on_conflict = 3
+        try:
+            response = self.api_client.patch(detail_url, format="json", data={"number": 3},
+                                             HTTP_IF_MATCH='"2"')
+            self.assertHttpAccepted(response)
+            self.assertEqual(response['ETag'], '"3"')
+
+            response = self.api_client.patch(detail_url, format="json", data={"number": 4},
+                                             HTTP_IF_MATCH='"2"')
+            self.assertEqual(response.status_code, 412)
+        finally:
+            resource._meta.update_retry_on_conflict = 0
+
+        response = self.api_client.delete(detail_url, HTTP_IF_MATCH='"3"')
+        self.assertHttpAccepted(response)
+
+    def test_put_detail(self):
+        base_url = self.resourceListURI('test')
+        detail_url = self.resourceDetailURI('test', 1)
+
+        response = self.api_client.post(base_url, format="json",
+                                        data=dict(_id=1, name="Person 1", number=1))
+        self.assertHttpCreated(response)
+
+        response = self.api_client.put(detail_url, format="json",
+                                       data=dict(name="Person 1", number=2),
+                                       HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 204)
+
+        response = self.api_client.get(detail_url)
+        self.assertHttpOK(response)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(json.loads(response.content)['number'], 2)
+
+        # the document moved on since the first version
+        response = self.api_client.put(detail_url, format="json",
+                                       data=dict(name="Person 1", number=3),
+                                       HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+
+        response = self.api_client.put(detail_url, format="json",
+                                       data=dict(name="Person 1", number=3))
+        self.assertEqual(response.status_code, 204)
+
+    def test_list_etag(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        response = self.api_client.post(base_url, format="json",
+                                        data=dict(name="Person 1", number=1))
+        self.assertHttpCreated(response)
+
+        resource._meta.list_validator = 'stats'
+        try:
+            response = self.api_client.get(base_url, data={'number': 1})
+            self.assertHttpOK(response)
+            etag = response['ETag']
+
+            with mock.patch.object(resource.client, 'search') as search:
+                response = self.api_client.get(base_url, data={'number': 1},
+                                               HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(search.called)
+
+            response = self.api_client.get(base_url, data={'number': 2},
+                                           HTTP_IF_NONE_MATCH=etag)
+            self.assertHttpOK(response)
+
+            response = self.api_client.post(base_url, format="json",
+                                            data=dict(name="Person 2", number=1))
+            self.assertHttpCreated(response)
+
+            response = self.api_client.get(base_url, data={'number': 1},
+                                           HTTP_IF_NONE_MATCH=etag)
+            self.assertHttpOK(response)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(len(json.loads(response.content)['objects']), 2)
+        finally:
+            resource._meta.list_validator = None
+
+    def test_list_etag_generation(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        class LocalResource(tastypie_elasticsearch_resources.ElasticsearchResource):
+            class Meta:
+                index = doc_type = resource_name = "local"
+                list_validator = 'generation'
+                search_cache = 'local'
+
+        class NeverResource(tastypie_elasticsearch_resources.ElasticsearchResource):
+            class Meta:
+                index = doc_type = resource_name = "never"
+                list_validator = 'generation'
+                search_cache = 'django'
+                refresh = 'never'
+
+        self.assertRaises(exceptions.ImproperlyConfigured, LocalResource)
+        self.assertRaises(exceptions.ImproperlyConfigured, NeverResource)
+
+        response = self.api_client.post(base_url, format="json",
+                                        data=dict(name="Person 1", number=1))
+        self.assertHttpCreated(response)
+
+        resource._meta.list_validator = 'generation'
+        resource._meta.search_cache = 'django'
+        try:
+            # not searchable yet, but the generation is bumped already
+            response = self.api_client.post(base_url + '?refresh=never', format="json",
+                                            data=dict(name="Person 2", number=1))
+            self.assertHttpCreated(response)
+
+            response = self.api_client.get(base_url, data={'number': 1})
+            self.assertHttpOK(response)
+            etag = response['ETag']
+
+            # the refresh that makes the write visible changes the ETag
+            resource.client.indices.refresh(resource._meta.index)
+
+            response = self.api_client.get(base_url, data={'number': 1},
+                                           HTTP_IF_NONE_MATCH=etag)
+            self.assertHttpOK(response)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(len(json.loads(response.content)['objects']), 2)
+        finally:
+            resource._meta.list_validator = None
+            resource._meta.search_cache = None
+            resource._search_cache = None
+
+    def test_count_only(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+
+        for i in range(5):
+            response = self.api_client.post(base_url,
+                format="json", data=dict(name="Person %d" % (i + 1), number=i+1))
+            self.assertHttpCreated(response)
+
+        with mock.patch.object(resource.client, 'search',
+                               wraps=resource.client.search) as search:
+            for params in ({'count_only': 'true', 'order_by': 'number', 'limit': 2},
+                           {'limit': 0}):
+                params['number__gt'] = 2
+                response = self.api_client.get(base_url, data=params)
+                self.assertHttpOK(response)
+
+                result = json.loads(response.content)
+                self.assertEqual(result['objects'], [])
+                self.assertEqual(result['meta']['total_count'], 3)
+                self.assertEqual(result['meta']['limit'], 0)
+                self.assertEqual(result['meta']['next'], None)
+                self.assertEqual(result['meta']['previous'], None)
+
+                body = search.call_args[1]['body']
+                self.assertEqual(body['size'], 0)
+                self.assertEqual(body['_source'], False)
+                self.assertFalse('sort' in body)
+
+    def test_source_filtering(self):
+        base_url = self.resourceListURI('test')
+
+        obj = dict(_id=1, first_name="John", last_name="Doe", blob="x" * 1000)
+        response = self.api_client.post(base_url, format="json", data=obj)
+        self.assertHttpCreated(response)
+
+        response = self.api_client.get(base_url, data={'fields': 'first_name'})
+        self.assertHttpOK(response)
+        obj = json.loads(response.content)['objects'][0]
+        self.assertEqual(sorted(obj.keys()), ['first_name', 'resource_uri'])
+
+        response = self.api_client.get(self.resourceDetailURI('test', 1),
+                                       data={'fields': 'last_name'})
+        self.assertHttpOK(response)
+        self.assertFalse('blob' in json.loads(response.content))
+
+        response = self.api_client.get(base_url + 'set/1/', data={'fields': 'last_name'})
+        obj = json.loads(response.content)['objects'][0]
+        self.assertEqual(sorted(obj.keys()), ['last_name', 'resource_uri'])
+
     def test_percolator(self):
         resource_name = 'test'
         base_url = self.resourceListURI(resource_name)
@@ -251,5 +931,331 @@ class BasicTest(TastypieElasticsearchTest):
     
         self.assertTrue("matches" in meta)
         self.assertTrue(isinstance(meta.get('matches'), list))
-    
-        
\ No newline at end of file
+
+    def test_percolator_bulk(self):
+        resource = urls.v1_api._registry['test']
+        base_url = self.resourceListURI('test')
+        docs = [{"name": "python %d" % i} for i in range(5)]
+
+        chunk_size = resource._meta.percolate_chunk_size
+        resource._meta.percolate_chunk_size = 2
+        try:
+            response = self.api_client.post(base_url + 'percolate/bulk/',
+                format='json', data=docs)
+            self.assertHttpOK(response)
+            lines = self.responseContent(response).splitlines()
+            self.assertEqual(len(lines), 5)
+            for line in lines:
+                self.assertTrue(isinstance(json.loads(line).get('matches'), list))
+
+            body = "\n".join(json.dumps(doc) for doc in docs[:2]) + "\nnot json\n"
+            response = self.client.post(base_url + 'percolate/bulk/?format=json',
+                data=body, content_type='application/x-ndjson')
+            self.assertHttpOK(response)
+            results = json.loads(self.responseContent(response))
+            self.assertEqual(len(results), 3)
+            self.assertTrue('matches' in results[1])
+            self.assertTrue('error' in results[2])
+
+            # short or malformed replies give errors, later chunks stay in order
+            matches = {"total": 1, "matches": [{"_id": "1"}]}
+            replies = [{"responses": [matches]}, {}, {"responses": [matches]}]
+            with mock.patch.object(resource.client, 'mpercolate', side_effect=replies):
+                response = self.api_client.post(base_url + 'percolate/bulk/',
+                    format='json', data=docs)
+                lines = [json.loads(line) for line in
+                         self.responseContent(response).splitlines()]
+            self.assertEqual(['matches' in line for line in lines],
+                             [True, False, False, False, True])
+            self.assertEqual(['error' in line for line in lines],
+                             [False, True, True, True, False])
+        finally:
+            resource._meta.percolate_chunk_size = chunk_size
+
+
+class ElasticsearchResultTest(unittest.TestCase):
+
+    def test_wraps_response(self):
+        hits = [{"_id": "1"}, {"_id": "2"}]
+        response = {"took": 3, "timed_out": False, "_shards": {"total": 1},
+                    "hits": {"total": 10, "max_score": 1.0, "hits": hits}}
+        result = ElasticsearchResult(response)
+
+        self.assertEqual(len(result), 2)
+        self.assertEqual(list(result), hits)
+        self.assertTrue(result[1] is hits[1])
+        self.assertEqual(result[len(result) - 1]["_id"], "2")
+        self.assertEqual((result.took, result.total, result.max_score), (3, 10, 1.0))
+        self.assertEqual(result.facets, [])
+        self.assertRaises(AttributeError, setattr, result, "extra", 1)
+
+
+class ETagTest(unittest.TestCase):
+
+    def test_etag_matches(self):
+        self.assertEqual(parse_etags('"1", W/"2"'), ['"1"', '"2"'])
+        self.assertTrue(etag_matches('"1", "2"', '"2"'))
+        self.assertTrue(etag_matches('*', '"3"'))
+        self.assertFalse(etag_matches('"1"', '"3"'))
+        self.assertFalse(etag_matches(None, '"3"'))
+
+
+class ConnectionsTest(unittest.TestCase):
+
+    def setUp(self):
+        connections._reset()
+
+    def tearDown(self):
+        connections._reset()
+
+    @mock.patch('elasticsearch.Elasticsearch')
+    def test_shared_client(self, Elasticsearch):
+        Elasticsearch.side_effect = lambda **kwargs: mock.Mock()
+
+        client = connections.get_client("127.0.0.1:9200", None, 30, maxsize=5)
+        self.assertTrue(connections.get_client("127.0.0.1:9200", None, 30, maxsize=5) is client)
+        self.assertEqual(Elasticsearch.call_count, 1)
+        self.assertEqual(Elasticsearch.call_args[1]['hosts'],
+                         [{"host": "127.0.0.1", "port": "9200"}])
+
+        self.assertFalse(connections.get_client("127.0.0.1:9200", None, 30, maxsize=10) is client)
+        self.assertFalse(connections.get_client("127.0.0.1:9200", None, 10, maxsize=5) is client)
+        self.assertEqual(Elasticsearch.call_count, 3)
+
+    @mock.patch('os.getpid')
+    @mock.patch('elasticsearch.Elasticsearch')
+    def test_fork(self, Elasticsearch, getpid):
+        Elasticsearch.side_effect = lambda **kwargs: mock.Mock()
+
+        getpid.return_value = 1
+        connections._reset()
+        client = connections.get_client("127.0.0.1:9200", None, 30)
+        self.assertTrue(connections.get_client("127.0.0.1:9200", None, 30) is client)
+
+        getpid.return_value = 2
+        child = connections.get_client("127.0.0.1:9200", None, 30)
+        self.assertFalse(child is client)
+        self.assertTrue(connections.get_client("127.0.0.1:9200", None, 30) is child)
+        self.assertEqual(Elasticsearch.call_count, 2)
+
+
+class FastDehydrateTest(unittest.TestCase):
+
+    def test_same_output(self):
+        resource = urls.v1_api._registry['test']
+        hits = [
+            {"_id": "1", "_source": {"name": "Person 1", "number": 1}},
+            {"_id": "a b", "_source": {"name": "Person 2", "tags": ["x", "y"]}},
+            {"_id": "3", "fields": {"name": ["Person 3"]}},
+            {"_id": "4"},
+        ]
+
+        bundles = resource.dehydrate_objects(None, hits)
+        resource._meta.fast_dehydrate = True
+        try:
+            fast = resource.dehydrate_objects(None, hits)
+        finally:
+            resource._meta.fast_dehydrate = False
+
+        self.assertEqual(fast, [bundle.data for bundle in bundles])
+        self.assertEqual(fast[1]['resource_uri'], resource.get_detail_uri("a b"))
+        self.assertEqual(fast[2]['name'], ["Person 3"])
+
+    def test_improperly_configured(self):
+        class FieldResource(tastypie_elasticsearch_resources.ElasticsearchResource):
+            name = tastypie_fields.CharField(attribute='name')
+
+            class Meta:
+                index = doc_type = resource_name = "field"
+                fast_dehydrate = True
+
+        class DehydrateResource(tastypie_elasticsearch_resources.ElasticsearchResource):
+            class Meta:
+                index = doc_type = resource_name = "dehydrate"
+                fast_dehydrate = True
+
+            def dehydrate(self, bundle):
+                return bundle
+
+        self.assertRaises(exceptions.ImproperlyConfigured, FieldResource)
+        self.assertRaises(exceptions.ImproperlyConfigured, DehydrateResource)
+
+
+class DetailURITest(unittest.TestCase):
+
+    def test_detail_uri(self):
+        resource = urls.v1_api._registry['test']
+
+        for pk in ["1", "AVx-3_b.c", u"caf\xe9", "a b/c", "None"]:
+            self.assertEqual(resource.get_detail_uri(pk),
+                urlresolvers.reverse('api_dispatch_detail', kwargs={
+                    'api_name': 'v1', 'resource_name': 'test', 'pk': pk}))
+
+
+class RawJSONTest(unittest.TestCase):
+
+    def test_split_search_response(self):
+        source = {"name": "x\"}]{[", "hits": {"hits": []}, "tags": [1, {"a": None}]}
+        response = {
+            "took": 1, "timed_out": False, "_shards": {"total": 1},
+            "hits": {"total": 2, "max_score": 1.0, "hits": [
+                {"_id": "1", "_score": 1.0, "_source": source},
+                {"_id": "2", "_score": 1.0, "fields": {"name": ["y"]}},
+            ]},
+            "facets": {},
+        }
+        for raw in (json.dumps(response), json.dumps(response, indent=2)):
+            result, hits = split_search_response(raw)
+
+            self.assertEqual(result["hits"], {"total": 2, "max_score": 1.0, "hits": []})
+            self.assertEqual(result["facets"], {})
+            self.assertEqual([hit["_id"] for hit, raw_source in hits], ["1", "2"])
+            self.assertEqual(json.loads(hits[0][1]), source)
+            self.assertEqual(json.loads(hits[1][1]), {"name": ["y"]})
+
+    def test_deep_nesting(self):
+        source = {"a": 1}
+        for i in range(rawjson.MAX_DEPTH + 2):
+            source = {"x": [source, "}]"]}
+        response = {"hits": {"total": 1, "hits": [{"_id": "1", "_source": source}]}}
+
+        result, hits = split_search_response(json.dumps(response))
+        self.assertEqual(json.loads(hits[0][1]), source)
+
+
+class RawSearchTest(unittest.TestCase):
+
+    def test_retries(self):
+        resource = urls.v1_api._registry['test']
+
+        failing = mock.Mock()
+        failing.perform_request.side_effect = elasticsearch.exceptions.ConnectionError(
+            "N/A", "refused", None)
+        working = mock.Mock()
+        working.perform_request.return_value = (200, {}, '{"took": 1}')
+
+        client = mock.Mock()
+        client.transport.serializer.dumps = json.dumps
+        client.transport.max_retries = 3
+        client.transport.get_connection.side_effect = [failing, working]
+
+        with mock.patch.object(type(resource), 'client', new_callable=mock.PropertyMock,
+                               return_value=client):
+            self.assertEqual(resource.send_raw_search({"size": 1}), '{"took": 1}')
+
+        client.transport.mark_dead.assert_called_once_with(failing)
+        client.transport.connection_pool.mark_live.assert_called_once_with(working)
+
+
+class SearchCacheTest(unittest.TestCase):
+
+    def test_lru(self):
+        cache = LocalCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_generation(self):
+        for backend in ('local', 'django'):
+            cache = SearchCache(backend, ttl=60)
+            body = {"query": {"match_all": {}}, "size": 20}
+
+            cache.set(cache.make_key('test', 'test', body), {"hits": {}})
+            self.assertEqual(cache.get(cache.make_key('test', 'test', dict(body))),
+                             {"hits": {}})
+
+            cache.bump_generation('test')
+            self.assertEqual(cache.get(cache.make_key('test', 'test', body)), None)
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_coalesce(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def search():
+            calls.append(1)
+            # wait for the other callers to queue up behind this one
+            deadline = time.time() + 5
+            while flight.coalesced < 4 and time.time() < deadline:
+                time.sleep(0.01)
+            return {"hits": {}}
+
+        def run():
+            results.append(flight.do("key", search))
+
+        threads = [threading.Thread(target=run) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"hits": {}}] * 5)
+        self.assertEqual(flight.stats(), {"calls": 1, "coalesced": 4})
+
+    def test_exception(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        self.assertRaises(ValueError, flight.do, "key", fail)
+        self.assertEqual(flight.do("key", lambda: 1), 1)
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.transport.serializer.dumps = json.dumps
+        self.client.bulk.side_effect = lambda body, **kwargs: {
+            "took": 1, "errors": False,
+            "items": [{"index": {}}] * (body.count("\n") / 2),
+        }
+
+    def test_max_actions(self):
+        writer = BulkWriter(self.client, max_actions=2)
+        for i in range(5):
+            writer.add({"index": {"_id": i}}, {"number": i})
+        result = writer.close()
+
+        self.assertEqual(self.client.bulk.call_count, 3)
+        self.assertEqual(len(result["items"]), 5)
+        self.assertEqual(result["took"], 3)
+
+    def test_max_bytes(self):
+        writer = BulkWriter(self.client, max_bytes=64)
+        for i in range(4):
+            writer.add({"index": {"_id": i}}, {"name": "x" * 20})
+        writer.close()
+
+        self.assertEqual(self.client.bulk.call_count, 4)
+
+    def test_on_chunk(self):
+        chunks = []
+        writer = BulkWriter(self.client, max_actions=2, on_chunk=chunks.append,
+                            keep_items=False)
+        for i in range(3):
+            writer.add({"index": {"_id": i}}, {"number": i})
+        result = writer.close()
+
+        self.assertEqual([len(chunk["items"]) for chunk in chunks], [2, 1])
+        self.assertEqual(result["items"], [])
+        self.assertEqual(writer.actions, 3)
+
+    def test_threads(self):
+        with BulkWriter(self.client, max_actions=1, threads=2) as writer:
+            for i in range(6):
+                writer.add({"index": {"_id": i}}, {"number": i})
+            result = writer.close()
+
+        self.assertEqual(self.client.bulk.call_count, 6)
+        self.assertEqual(len(result["items"]), 6)
@@ -6,6 +6,7 @@ from tests.test_app import resources
 
 v1_api = api.Api(api_name='v1')
 v1_api.register(resources.TestResource())
+v1_api.register(resources.CursorTestResource())
 
 urlpatterns = patterns('',
     url(r'^api/', include(v1_api.urls)),